@@ -0,0 +1,134 @@
+# Chart payload benchmark, inline JSON against Arrow chart data.
+#
+# Builds every chart variant (see green_bonds/export.py) from the recorded
+# fixtures in both GB_CHART_DATA modes and reports, per chart:
+#
+#   spec_bytes   size of the memoized spec, inline JSON rows or Arrow bytes
+#   wire_bytes   size of the message Streamlit sends to the browser
+#   marshal_ms   Streamlit's per-rerun work to turn the spec into that message
+#   build_ms     one-time cost of building the spec
+#
+# Streamlit converts inline rows to Arrow before sending them, so the wire
+# size is close in both modes; the difference is the per-rerun conversion
+# and the memory held by the spec cache. Browser render time needs a real
+# browser and is not measured here.
+#
+#     python benchmarks/bench_payload.py
+#     python benchmarks/bench_payload.py --scales 1 10 --output payload.jsonl
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from bench_rerun import FIXTURES, scale_fixtures  # noqa: E402
+
+
+def _marshal(spec, repeat):
+    from streamlit.elements import vega_charts
+    from streamlit.proto.VegaLiteChart_pb2 import VegaLiteChart
+
+    times = []
+    for _ in range(repeat):
+        proto = VegaLiteChart()
+        start = time.perf_counter()
+        vega_charts._marshall_chart_data(proto, dict(spec))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), proto.ByteSize()
+
+
+def measure(scale, repeat):
+    """Compare both modes in this process, env must already point at the fixtures."""
+    from green_bonds import charts, data, export
+
+    loaded = {name: data.get(name) for name in export.NAMES}
+    variants = list(export.variants(loaded))
+
+    totals = {}
+    for mode in ('json', 'arrow'):
+        charts.CHART_DATA = mode
+        for variant in variants:
+            function = getattr(charts, variant['chart'])
+            function.cache_clear()
+            start = time.perf_counter()
+            spec = function(*[loaded[name] for name in variant['datasets']], *variant['args'])
+            build = time.perf_counter() - start
+            marshal, wire = _marshal(spec, repeat)
+            entry = totals.setdefault((variant['chart'], mode), {'specs': 0, 'spec_bytes': 0, 'wire_bytes': 0, 'marshal_s': 0, 'build_s': 0})
+            entry['specs'] += 1
+            entry['spec_bytes'] += charts.payload_bytes(spec)
+            entry['wire_bytes'] += wire
+            entry['marshal_s'] += marshal
+            entry['build_s'] += build
+
+    for (chart, mode), entry in totals.items():
+        yield {
+            'scale': scale,
+            'chart': chart,
+            'mode': mode,
+            'specs': entry['specs'],
+            'spec_bytes': entry['spec_bytes'],
+            'wire_bytes': entry['wire_bytes'],
+            'marshal_ms': round(entry['marshal_s'] * 1000, 3),
+            'build_ms': round(entry['build_s'] * 1000, 3),
+        }
+
+
+def run(scales, repeat, fixtures):
+    """Benchmark every scale in a fresh subprocess, yields result records."""
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = pathlib.Path(tmp) / 'fixtures'
+            scale_fixtures(fixtures, directory, scale)
+            env = dict(
+                os.environ,
+                GB_SOURCE_BASE_URL=str(directory),
+                GB_SNAPSHOT_DIR=str(pathlib.Path(tmp) / 'snapshots'),
+            )
+            out = subprocess.run(
+                [sys.executable, __file__, 'child', '--scale', str(scale), '--repeat', str(repeat)],
+                env=env, cwd=ROOT, check=True, stdout=subprocess.PIPE, text=True,
+            ).stdout
+        for line in out.splitlines():
+            if line.startswith('{'):
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare inline JSON and Arrow chart payloads.')
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'child'])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1], help='fixture scale factors (default 1)')
+    parser.add_argument('--scale', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--repeat', type=int, default=5, help='marshalling runs per spec (default 5)')
+    parser.add_argument('--fixtures', default=str(FIXTURES), help='directory of source CSVs')
+    parser.add_argument('--output', help='also append JSON lines to this file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'child':
+        for result in measure(args.scale, args.repeat):
+            print(json.dumps(result), flush=True)
+        return 0
+
+    output = open(args.output, 'a') if args.output else None
+    try:
+        for result in run(args.scales, args.repeat, args.fixtures):
+            line = json.dumps(result)
+            print(line, flush=True)
+            if output:
+                output.write(line + '\n')
+    finally:
+        if output:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,226 @@
+# Rerun latency benchmark for main_gb.py.
+#
+# Runs the dashboard headlessly with Streamlit's AppTest against CSV fixtures
+# served from a local HTTP server standing in for Google Sheets, and times
+# the cold start, a plain rerun and each widget interaction. Every scale runs
+# in a fresh process so cold start really is cold. Results are JSON lines.
+#
+#     python benchmarks/bench_rerun.py                       # 1x fixtures
+#     python benchmarks/bench_rerun.py --scales 1 10 100 --output results.jsonl
+#     python benchmarks/bench_rerun.py record                # refresh fixtures from the live sheets
+#
+# A scale of N multiplies the countries (and use-of-proceeds rows) and the
+# years of every fixture by N.
+import argparse
+import contextlib
+import functools
+import http.server
+import json
+import os
+import pathlib
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+FIXTURES = pathlib.Path(__file__).resolve().parent / 'fixtures'
+SCRIPT = ROOT / 'main_gb.py'
+
+# (step, widget type, widget label, the two values alternated between)
+INTERACTIONS = [
+    ('issuer_year', 'select_slider', 'Select Year', lambda w: (w.options[0], w.options[-1])),
+    ('region_year', 'select_slider', 'Select a year', lambda w: (w.options[0], w.options[-1])),
+    ('region', 'selectbox', 'Select a region', lambda w: (w.options[1], w.options[0])),
+    ('country', 'selectbox', 'Select Country', lambda w: (w.options[1], w.options[0])),
+]
+
+
+@contextlib.contextmanager
+def serve(directory):
+    """Serve `directory` over HTTP on a free local port, yields the base URL."""
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=str(directory)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+
+
+def _extend_years(frame, factor):
+    # Prepend earlier years, repeating the recorded values
+    from green_bonds import tidy
+
+    years = tidy.year_columns(frame)
+    if factor == 1 or not years:
+        return frame
+    columns = list(years)
+    first = min(years.values())
+    extra = {}
+    for i in range(len(columns) * (factor - 1)):
+        year = first - len(columns) * (factor - 1) + i
+        extra[str(year)] = frame[columns[i % len(columns)]]
+    ids = frame.drop(columns=columns)
+    return pd.concat([ids, pd.DataFrame(extra), frame[columns]], axis=1)
+
+
+def _repeat_rows(frame, factor, column):
+    if factor == 1:
+        return frame
+    copies = []
+    for i in range(factor):
+        copy = frame.copy()
+        if i:
+            copy[column] = copy[column].astype(str) + f' #{i}'
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def scale_fixtures(source, target, factor):
+    """Write the fixtures in `source` scaled up by `factor` to `target`."""
+    target = pathlib.Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    rows = {'bond': 'Country', 'expenditure': 'Country', 'gdp': 'Country', 'use': 'Use_of_Proceed'}
+    for path in pathlib.Path(source).glob('*.csv'):
+        frame = pd.read_csv(path)
+        if path.stem in rows:
+            frame = _repeat_rows(frame, factor, rows[path.stem])
+        frame = _extend_years(frame, factor)
+        frame.to_csv(target / path.name, index=False)
+
+
+def _timed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def _widget(at, kind, label):
+    for widget in getattr(at, kind):
+        if widget.label == label:
+            return widget
+    raise LookupError(f'No {kind} labelled {label!r}')
+
+
+def measure(scale, repeat):
+    """Benchmark one scale in this process, env must already point at the fixtures."""
+    sys.path.insert(0, str(ROOT))
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(SCRIPT), default_timeout=600)
+    results = []
+
+    def record(step, times):
+        results.append({
+            'scale': scale,
+            'step': step,
+            'runs': len(times),
+            'median_s': statistics.median(times),
+            'min_s': min(times),
+            'max_s': max(times),
+        })
+
+    def check():
+        if at.exception:
+            raise RuntimeError(f'main_gb.py raised: {at.exception[0].message}')
+
+    record('cold_start', [_timed(at.run)])
+    check()
+    record('rerun', [_timed(at.run) for _ in range(repeat)])
+
+    for step, kind, label, values in INTERACTIONS:
+        times = []
+        for i in range(repeat):
+            widget = _widget(at, kind, label)
+            widget.set_value(values(widget)[i % 2])
+            times.append(_timed(at.run))
+            check()
+        record(step, times)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    results.append({'scale': scale, 'step': 'peak_memory', 'peak_rss_mb': round(peak, 1)})
+    return results
+
+
+def run(scales, repeat, fixtures):
+    """Benchmark every scale in a fresh subprocess, yields result records."""
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = pathlib.Path(tmp) / 'fixtures'
+            scale_fixtures(fixtures, directory, scale)
+            with serve(directory) as base_url:
+                env = dict(
+                    os.environ,
+                    GB_SOURCE_BASE_URL=base_url,
+                    GB_SNAPSHOT_DIR=str(pathlib.Path(tmp) / 'snapshots'),
+                )
+                out = subprocess.run(
+                    [sys.executable, __file__, 'child', '--scale', str(scale), '--repeat', str(repeat)],
+                    env=env, cwd=ROOT, check=True, stdout=subprocess.PIPE, text=True,
+                ).stdout
+        for line in out.splitlines():
+            if line.startswith('{'):
+                yield json.loads(line)
+
+
+def record_fixtures(target):
+    """Download the live sheets into `target`."""
+    sys.path.insert(0, str(ROOT))
+    from green_bonds import data, snapshots
+
+    target = pathlib.Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    for name, url in data.SOURCES.items():
+        if not url:
+            continue
+        response = snapshots.session().get(url, timeout=data.FETCH_TIMEOUT)
+        response.raise_for_status()
+        (target / f'{name}.csv').write_bytes(response.content)
+        print(f'{name}: {len(response.content)} bytes')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark main_gb.py rerun latency.')
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'record', 'child'])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1], help='fixture scale factors (default 1)')
+    parser.add_argument('--scale', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--repeat', type=int, default=5, help='runs per interaction (default 5)')
+    parser.add_argument('--fixtures', default=str(FIXTURES), help='directory of source CSVs')
+    parser.add_argument('--output', help='also append JSON lines to this file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record_fixtures(args.fixtures)
+        return 0
+
+    if args.command == 'child':
+        for result in measure(args.scale, args.repeat):
+            print(json.dumps(result), flush=True)
+        return 0
+
+    sys.path.insert(0, str(ROOT))
+    output = open(args.output, 'a') if args.output else None
+    try:
+        for result in run(args.scales, args.repeat, args.fixtures):
+            line = json.dumps(result)
+            print(line, flush=True)
+            if output:
+                output.write(line + '\n')
+    finally:
+        if output:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1 @@
+# Data and chart helpers for the Green Economy Dashboard (main_gb.py)
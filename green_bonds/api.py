@@ -0,0 +1,276 @@
+# Headless HTTP API serving the dashboard's aggregates.
+#
+# The numbers the page shows, from the same process-wide data layer and
+# memoized tables, as JSON or Arrow:
+#
+#     python -m green_bonds.api --port 8502
+#     curl 'localhost:8502/v1/country-rankings?year=2021&region=Asia'
+#     curl 'localhost:8502/v1/country-rankings?year=2020&year=2021&region=All&region=Asia&format=arrow'
+#
+# Repeating a parameter asks for every combination in one response (bulk),
+# leaving it out asks for all of them, see ENDPOINTS. Every response carries
+# an ETag derived from the versions of the datasets it was computed from, so
+# polling with If-None-Match gets a 304 without any work while the data is
+# unchanged. Encoded (and gzipped) bodies are memoized per data version.
+import argparse
+import functools
+import gzip
+import hashlib
+import http.server
+import json
+import logging
+import os
+import urllib.parse
+
+import pandas as pd
+
+from green_bonds import charts, data, derived, instrument, metrics, query, schema, tidy
+
+log = logging.getLogger(__name__)
+
+# Seconds clients may reuse a response before revalidating, override with GB_API_MAX_AGE
+MAX_AGE = int(os.environ.get('GB_API_MAX_AGE', 60))
+
+# Smaller bodies are sent uncompressed
+GZIP_MIN_BYTES = 1024
+
+# Maximum number of memoized response bodies, override with GB_API_CACHE_SIZE
+API_CACHE_SIZE = int(os.environ.get('GB_API_CACHE_SIZE', 256))
+
+ARROW = 'application/vnd.apache.arrow.stream'
+
+
+class BadRequest(ValueError):
+    """A query parameter is missing or invalid."""
+
+
+def _years(params, dataset):
+    try:
+        return [int(year) for year in params.get('year', [])] or list(tidy.years(dataset))
+    except ValueError:
+        raise BadRequest('year must be an integer') from None
+
+
+def _concat(frames):
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def yearly_totals(issuer, params):
+    """Year, Value and Percentage Difference from the year before."""
+    return metrics.yearly_totals(issuer).reset_index()
+
+
+def issuer_shares(issuer, params):
+    """Every issuer's share of each `year` (default every year) in rank order."""
+    return _concat([query.issuer_year(issuer, year) for year in _years(params, issuer)])
+
+
+def country_rankings(bond, params):
+    """Countries of every (`year`, `region`) pair, default every year and region 'All'.
+
+    Selected Region tells the slices apart, the rows of 'All' keep each
+    country's own Region.
+    """
+    regions = params.get('region') or ['All']
+    slices = [
+        query.country_ranking(bond, year, region).assign(**{'Selected Region': region})
+        for year in _years(params, bond)
+        for region in regions
+    ]
+    return _concat(slices)
+
+
+def categories(use, params):
+    """Total, Maximum and Minimum Value of each use-of-proceeds Category."""
+    return query.category_stats(use).reset_index()
+
+
+def expenditure(expenditure, params):
+    """Expenditure per (Indicator, Year) of each `country`, default every country."""
+    countries = params.get('country') or tidy.expenditure_countries(expenditure)
+    return _concat([query.country_expenditure(expenditure, country) for country in countries])
+
+
+# path -> (function, datasets it reads, accepted parameters)
+ENDPOINTS = {
+    '/v1/yearly-totals': (yearly_totals, ('issuer',), ()),
+    '/v1/issuer-shares': (issuer_shares, ('issuer',), ('year',)),
+    '/v1/country-rankings': (country_rankings, ('bond',), ('year', 'region')),
+    '/v1/categories': (categories, ('use',), ()),
+    '/v1/expenditure': (expenditure, ('expenditure',), ('country',)),
+}
+
+
+def etag(path, params, fmt, datasets):
+    """Validator of a response, changes with the request and the data versions."""
+    key = repr((path, params, fmt, [(dataset.name, dataset.version) for dataset in datasets]))
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:20] + '"'
+
+
+def accepts_gzip(header):
+    """Whether an Accept-Encoding `header` allows a gzip body.
+
+    gzip (or its x-gzip alias) must be listed with a q-value above 0, or
+    `*` must be, without gzip being listed at all. Malformed q-values count
+    as 0.
+    """
+    weights = {}
+    for item in header.split(','):
+        coding, *options = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        weight = 1.0
+        for option in options:
+            name, _, value = option.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        coding = coding.lower()
+        weights['gzip' if coding == 'x-gzip' else coding] = weight
+    return weights.get('gzip', weights.get('*', 0.0)) > 0
+
+
+def _json(frame, datasets):
+    rows = frame.to_json(orient='records', date_format='iso')
+    versions = json.dumps({dataset.name: dataset.version for dataset in datasets})
+    return f'{{"datasets":{versions},"rows":{rows}}}'.encode()
+
+
+@functools.lru_cache(maxsize=API_CACHE_SIZE)
+def response(path, params, fmt, *datasets):
+    """(body, gzipped body or None) of an endpoint, memoized per data version.
+
+    `params` is a tuple of (name, values) pairs, `fmt` 'json' or 'arrow'.
+    """
+    function = ENDPOINTS[path][0]
+    with instrument.stage(f'api.{path.rsplit("/", 1)[-1]}'):
+        frame = schema.plain_floats(function(*datasets, dict(params)))
+        body = charts.arrow_bytes(frame) if fmt == 'arrow' else _json(frame, datasets)
+    compressed = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+    instrument.observe('gb_api_body_bytes', len(body), endpoint=path, format=fmt)
+    return body, compressed
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    server_version = 'green-bonds-api'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.debug('%s %s', self.address_string(), format % args)
+
+    def _send(self, status, body=b'', content_type='application/json', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({'error': message}).encode())
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+        status = 200
+        try:
+            if path == '/':
+                status = self._index()
+            elif path == '/metrics':
+                self._send(200, instrument.prometheus().encode(), 'text/plain; version=0.0.4')
+            elif path in ENDPOINTS:
+                status = self._endpoint(path, urllib.parse.parse_qs(url.query))
+            else:
+                status = 404
+                self._error(404, f'Unknown path {path!r}, see /')
+        except BadRequest as e:
+            status = 400
+            self._error(400, str(e))
+        except data.Unavailable as e:
+            status = 503
+            self._error(503, str(e))
+        except Exception:
+            log.exception('Serving %s failed', self.path)
+            status = 500
+            self._error(500, 'internal error')
+        instrument.count('gb_api_requests_total', endpoint=path if path in ENDPOINTS else 'other', status=status)
+
+    def _index(self):
+        endpoints = {path: {'parameters': list(accepted), 'datasets': list(names)} for path, (_, names, accepted) in ENDPOINTS.items()}
+        body = {'endpoints': endpoints, 'formats': ['json', 'arrow'], 'datasets': data.status()}
+        self._send(200, json.dumps(body, default=str).encode())
+        return 200
+
+    def _format(self, params):
+        fmt = params.pop('format', [None])[-1]
+        if fmt is None:
+            fmt = 'arrow' if ARROW in self.headers.get('Accept', '') else 'json'
+        if fmt not in ('json', 'arrow'):
+            raise BadRequest("format must be 'json' or 'arrow'")
+        if fmt == 'arrow' and charts.pyarrow is None:
+            raise BadRequest('arrow needs pyarrow on the server, use format=json')
+        return fmt
+
+    def _endpoint(self, path, params):
+        fmt = self._format(params)
+        _, names, accepted = ENDPOINTS[path]
+        unknown = sorted(set(params) - set(accepted))
+        if unknown:
+            raise BadRequest(f"unknown parameters {', '.join(unknown)}, {path} accepts {', '.join(accepted) or 'none'}")
+        key = tuple(sorted((name, tuple(values)) for name, values in params.items()))
+        datasets = [data.get(name) for name in names]
+
+        tag = etag(path, key, fmt, datasets)
+        headers = [
+            ('ETag', tag),
+            ('Cache-Control', f'public, max-age={MAX_AGE}'),
+            ('Vary', 'Accept, Accept-Encoding'),
+            ('X-Data-Version', ','.join(f'{dataset.name}={dataset.version}' for dataset in datasets)),
+        ]
+        if tag in [value.strip() for value in self.headers.get('If-None-Match', '').split(',')]:
+            self._send(304, headers=headers)
+            return 304
+
+        body, compressed = response(path, key, fmt, *datasets)
+        if compressed is not None and accepts_gzip(self.headers.get('Accept-Encoding', '')):
+            body = compressed
+            headers.append(('Content-Encoding', 'gzip'))
+        self._send(200, body, ARROW if fmt == 'arrow' else 'application/json', headers)
+        return 200
+
+
+def serve(host='127.0.0.1', port=8502):
+    """Serve the API until interrupted."""
+    data.prefetch()
+    data.on_change(derived.rebuild)
+    instrument.start_exporter()
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    print(f'Serving on http://{host}:{server.server_port}/', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m green_bonds.api', description="Serve the dashboard's aggregates over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8502, help='port (default 8502)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,345 @@
+# Chart builders shared by the dashboard, with memoized Vega-Lite specs.
+#
+# Building an Altair chart and serializing it with to_dict() costs far more
+# than slicing the data behind it, and the country bar chart only ever shows
+# a handful of (year, region) combinations. Finished specs are therefore kept
+# in a bounded LRU cache keyed by the Dataset version and the widget values.
+#
+# Streamlit sends chart data to the browser as Arrow, converting a spec's
+# inline JSON rows on every rerun. With GB_CHART_DATA=arrow the memoized
+# specs carry their data as Arrow IPC bytes instead, converted once when the
+# spec is built, and Streamlit passes them through as they are. The
+# aggregations and sorts the charts need are already done here (per-year
+# slices, ranks, the expenditure cube), so the browser gets only the rows
+# its marks draw. `python benchmarks/bench_payload.py` compares both modes.
+import functools
+import json
+import os
+
+import altair as alt
+import pandas as pd
+
+from green_bonds import gdp, instrument, metrics, query, schema, tidy
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Maximum number of memoized specs per chart, override with GB_CHART_CACHE_SIZE
+CHART_CACHE_SIZE = int(os.environ.get('GB_CHART_CACHE_SIZE', 128))
+
+# Build every region's spec of the selected year up front, enable with GB_PREWARM_CHARTS=1
+PREWARM = os.environ.get('GB_PREWARM_CHARTS', '').lower() in ('1', 'true', 'yes')
+
+# How memoized specs carry their data: 'json' (inline rows) or 'arrow'
+CHART_DATA = os.environ.get('GB_CHART_DATA', 'json').lower()
+
+# Color palettes
+color_palette_2 = ['#FFABAB', '#a75cf7', '#ff5192', '#FF6F2F', '#ffc927', '#ffff36']
+new_color_palette_6 = ["#23511E", "#367D2F", "#59BD4F", "#8EC04C", "#B7CF3D", "#CBE626"]
+color_palette_21 = ['#0068C9', '#7AC5FF', '#a75cf7', '#ff5192', '#FF6F2F', '#ffc927', '#ffff36']
+
+
+def arrow_bytes(frame):
+    """Arrow IPC stream of `frame`, the format Streamlit sends chart data in."""
+    table = pyarrow.Table.from_pandas(frame)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.RecordBatchStreamWriter(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_arrow(spec):
+    """Copy of `spec` with its inline datasets as Arrow IPC bytes."""
+    datasets = {name: arrow_bytes(pd.DataFrame(values)) for name, values in spec.get('datasets', {}).items()}
+    return {**spec, 'datasets': datasets} if datasets else spec
+
+
+def payload_bytes(spec):
+    """Size of `spec` as sent to the browser, Arrow datasets counted as their bytes."""
+    datasets = spec.get('datasets', {})
+    binary = {name: values for name, values in datasets.items() if isinstance(values, bytes)}
+    rest = {**spec, 'datasets': {name: values for name, values in datasets.items() if name not in binary}}
+    return len(json.dumps(rest)) + sum(len(values) for values in binary.values())
+
+
+def _spec(name, chart):
+    # Serialize `chart`, recording the time it takes and the payload size
+    with instrument.stage(f'chart.{name}.serialize'):
+        spec = chart.to_dict()
+        if CHART_DATA == 'arrow' and pyarrow is not None:
+            spec = to_arrow(spec)
+    instrument.observe('gb_chart_payload_bytes', payload_bytes(spec), chart=name)
+    return spec
+
+
+# Function to create the bar chart of issuance summed per year
+def create_yearly_total_chart(df_sum):
+    selection = alt.selection_point(encodings=['x'])
+    return alt.Chart(schema.plain_floats(df_sum.reset_index())).mark_bar(color='#2B6224').encode(
+        x=alt.X('Year:O', axis=alt.Axis(labelAngle=0)),
+        y=alt.Y('Value:Q', title='Billion US Dollars'),
+        tooltip=['Year', 'Value', 'Percentage Difference'],
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.5)),
+    ).add_params(
+        selection
+    ).properties(
+        width=600,
+        height=400,
+        title='Sum of Green Bonds Issuance by Year'
+    )
+
+
+@functools.lru_cache(maxsize=2)
+@instrument.timed('chart.yearly_total')
+def yearly_total_spec(dataset):
+    """Vega-Lite spec of the overview bar chart, issuance of the issuer `dataset` summed per year."""
+    return _spec('yearly_total', create_yearly_total_chart(metrics.yearly_totals(dataset)))
+
+
+# Function to create horizontal bar chart of one year's country rows
+def create_bar_chart(filtered_df, year):
+    chart = alt.Chart(schema.plain_floats(filtered_df)).mark_bar().encode(
+        y=alt.Y('Country:N', title='Country', sort='-x', axis=alt.Axis(labelLimit=0)),
+        x=alt.X('Value:Q', title='Billion US Dollars'),
+        color=alt.Color('Region:N', scale=alt.Scale(range=color_palette_2)),
+        tooltip=['Country', 'Value', 'Region', 'Rank']
+    ).properties(
+        title=f'Green Bonds Issuance by Country in {year}'
+    )
+
+    return chart
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+@instrument.timed('chart.country_bar')
+def country_bar_spec(dataset, year, continent):
+    """Vega-Lite spec of the country bar chart for the bond `dataset`.
+
+    The returned dict is shared, callers must not modify it.
+    """
+    return _spec('country_bar', create_bar_chart(query.country_ranking(dataset, year, continent), int(year)))
+
+
+@functools.lru_cache(maxsize=2)
+def warm_country_bar_specs(dataset, year):
+    """Build the country bar spec of every region option of `year`.
+
+    One year at a time, every year at once would take more specs than the
+    cache holds and evict the ones just built.
+    """
+    for continent in ['All', *tidy.bond_regions(dataset)]:
+        country_bar_spec(dataset, year, continent)
+
+
+# Function to create the issuer pie chart of one year's share rows
+def create_issuer_pie_chart(df_year, year):
+    selection = alt.selection_point(fields=['Type_of_Issuer'])
+    chart = alt.Chart(df_year).mark_arc().encode(
+        alt.Color('Type_of_Issuer:N',
+                  legend=alt.Legend(title='Type of Issuer'),
+                  scale=alt.Scale(scheme='viridis')
+                  ).sort(field='Percentage', op='max', order='descending'),
+        tooltip=['Type_of_Issuer', 'Percentage', 'Rank', 'Share Change'],
+        theta='Percentage:Q',
+        order='Percentage:Q',
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.5))
+    ).add_params(
+        selection
+    ).properties(
+        width=400,
+        height=400,
+        title=f'Pie Chart for {year}'
+    )
+
+    return chart.configure_legend(labelLimit=0)  # Set labelLimit to 0 to show full category names
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+@instrument.timed('chart.issuer_pie')
+def issuer_pie_spec(dataset, year):
+    """Vega-Lite spec of the issuer pie chart of `year`, from the precomputed share table."""
+    return _spec('issuer_pie', create_issuer_pie_chart(query.issuer_year(dataset, year), year))
+
+
+# Function to create the issuer dot chart of one year's share rows
+def create_issuer_dot_chart(df_year, year):
+    return alt.Chart(df_year).mark_circle().encode(
+        alt.X('Value:Q', axis=None),
+        alt.Y('Type_of_Issuer:N', title='Type of Issuer', axis=alt.Axis(labelLimit=0)),
+        size='Value:Q',
+        color=alt.Color('Type_of_Issuer:N', scale=alt.Scale(scheme='viridis'), legend=None),
+        tooltip=['Type_of_Issuer', 'Value', 'Value Change']
+    ).properties(
+        width=600,
+        height=400,
+        title=f'Value Comparison for {year} in Billion US Dollars'
+    ).interactive()
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+@instrument.timed('chart.issuer_dot')
+def issuer_dot_spec(dataset, year):
+    """Vega-Lite spec of the issuer dot chart of `year`, from the precomputed share table."""
+    return _spec('issuer_dot', create_issuer_dot_chart(query.issuer_year(dataset, year), year))
+
+
+# Function to create the stacked issuer shares of every year
+def create_issuer_share_chart(df_shares):
+    selection = alt.selection_point(fields=['Type_of_Issuer'], bind='legend')
+    return alt.Chart(df_shares).mark_bar().encode(
+        x=alt.X('Year:O', axis=alt.Axis(labelAngle=0)),
+        y=alt.Y('Percentage:Q', title='Percentage of Issuance', stack='zero'),
+        color=alt.Color('Type_of_Issuer:N',
+                        legend=alt.Legend(title='Type of Issuer', labelLimit=0),
+                        scale=alt.Scale(scheme='viridis')),
+        order=alt.Order('Rank:Q'),
+        tooltip=['Year', 'Type_of_Issuer', 'Value', 'Percentage', 'Rank', 'Value Change', 'Share Change'],
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.3)),
+    ).add_params(
+        selection
+    ).properties(
+        height=400,
+        title='Share of Each Type of Issuer by Year'
+    )
+
+
+@functools.lru_cache(maxsize=2)
+@instrument.timed('chart.issuer_share')
+def issuer_share_spec(dataset):
+    """Vega-Lite spec of every year's issuer shares, from the precomputed share table."""
+    return _spec('issuer_share', create_issuer_share_chart(metrics.issuer_shares(dataset).reset_index()))
+
+
+# Function to create the pie chart of the use-of-proceeds categories
+def create_category_pie_chart(df_cat):
+    selection = alt.selection_point(fields=['Category'])
+    chart = alt.Chart(df_cat).mark_arc().encode(
+        alt.Color('Category:N',
+                  legend=alt.Legend(title='Use of Green Bond Category'),
+                  scale=alt.Scale(range=new_color_palette_6)
+                  ).sort(field='Percentage', op='max', order='descending'),
+        tooltip=['Category', 'Usage', 'Percentage'],
+        theta='Percentage:Q',
+        order='Percentage:Q',
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.5))
+    ).add_params(
+        selection
+    ).properties(
+        title='Use of Green Bond by Category in 2022'
+    )
+
+    return chart.configure_legend(labelLimit=0)
+
+
+@functools.lru_cache(maxsize=2)
+@instrument.timed('chart.category_pie')
+def category_pie_spec(dataset):
+    """Vega-Lite spec of the category pie chart of the use `dataset`."""
+    return _spec('category_pie', create_category_pie_chart(metrics.category_usage(dataset)))
+
+
+# Function to create the bar chart of one use-of-proceeds category
+def create_category_bar_chart(df_category, color):
+    selection = alt.selection_point(encodings=['x'])
+    return alt.Chart(schema.plain_floats(df_category)).mark_bar(color=color).encode(
+        y=alt.Y('Use_of_Proceed:N', sort='-x', title=None, axis=alt.Axis(labelLimit=0)),
+        x=alt.X('Value:Q', title='Value'),
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.5)),
+    ).add_params(
+        selection
+    )
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+@instrument.timed('chart.category_bar')
+def category_bar_spec(dataset, category):
+    """Vega-Lite spec of the details bar chart of `category` in the use `dataset`.
+
+    Categories are colored by their rank in total value.
+    """
+    rank = query.category_stats(dataset).index.get_loc(category)
+    color = new_color_palette_6[rank % len(new_color_palette_6)]
+    df_category = dataset.frame[dataset.frame['Category'] == category]
+    return _spec('category_bar', create_category_bar_chart(df_category, color))
+
+
+# Function to create the expenditure chart of one country from its cube rows
+def create_expenditure_chart(df_country):
+    chart = alt.Chart(schema.plain_floats(df_country)).mark_bar().encode(
+        x=alt.X('Year:O', axis=alt.Axis(labelAngle=0)),
+        y=alt.Y('Expenditure:Q', title='Percent of GDP'),
+        color=alt.Color('Indicator:N', scale=alt.Scale(range=color_palette_21)),
+        column='Country:N'
+    ).properties(
+        width=625,
+        height=400
+    )
+
+    return chart.configure_legend(labelLimit=0, orient='bottom', columns=2)
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+@instrument.timed('chart.expenditure')
+def expenditure_spec(dataset, country):
+    """Vega-Lite spec of the expenditure chart of `country`.
+
+    Carries only the pre-aggregated (Indicator, Year) rows of the country.
+    """
+    return _spec('expenditure', create_expenditure_chart(query.country_expenditure(dataset, country)))
+
+
+# Function to create small multiples of the expenditure of several countries
+def create_expenditure_comparison_chart(df_countries, columns=3):
+    chart = alt.Chart(schema.plain_floats(df_countries)).mark_bar().encode(
+        x=alt.X('Year:O', axis=alt.Axis(labelAngle=0)),
+        y=alt.Y('Expenditure:Q', title='Percent of GDP'),
+        color=alt.Color('Indicator:N', scale=alt.Scale(range=color_palette_21)),
+        tooltip=['Country', 'Indicator', 'Year', 'Expenditure'],
+        facet=alt.Facet('Country:N', columns=columns, title=None),
+    ).properties(
+        width=200,
+        height=150
+    )
+
+    return chart.configure_legend(labelLimit=0, orient='bottom', columns=2)
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+@instrument.timed('chart.expenditure_comparison')
+def expenditure_comparison_spec(dataset, countries):
+    """Vega-Lite spec comparing the expenditure of the `countries` tuple."""
+    return _spec('expenditure_comparison', create_expenditure_comparison_chart(tidy.expenditure_index(dataset).gather(countries)))
+
+
+# Tabs of the GDP section: (label, field of the joined GDP table, axis title)
+GDP_VIEWS = (
+    ('💵 GDP', 'GDP', 'Billion US Dollars'),
+    ('🌿 Green Bonds to GDP', 'Green Bonds (% of GDP)', 'Green Bonds in Percent of GDP'),
+    ('🌊 Expenditure to GDP', 'Expenditure (% of GDP)', 'Environmental Protection Expenditure in Percent of GDP'),
+)
+
+
+# Function to create a line chart of one column of the GDP table per country
+def create_gdp_chart(df_countries, field, title):
+    selection = alt.selection_point(fields=['Country'], bind='legend')
+    return alt.Chart(schema.plain_floats(df_countries)).mark_line(point=True).encode(
+        x=alt.X('Year:O', axis=alt.Axis(labelAngle=0)),
+        y=alt.Y(f'{field}:Q', title=title),
+        color=alt.Color('Country:N', legend=alt.Legend(labelLimit=0)),
+        tooltip=['Country', 'Year', 'GDP', 'Green Bonds', 'Green Bonds (% of GDP)', 'Expenditure (% of GDP)'],
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.2)),
+    ).add_params(
+        selection
+    ).transform_filter(
+        f'isValid(datum["{field}"])'
+    )
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+@instrument.timed('chart.gdp')
+def gdp_spec(gdp_ds, bond_ds, expenditure_ds, countries, field, title):
+    """Vega-Lite spec of `field` of the joined GDP table for the `countries` tuple."""
+    rows = gdp.green_gdp(gdp_ds, bond_ds, expenditure_ds, countries)
+    return _spec('gdp', create_gdp_chart(rows, field, title))
@@ -0,0 +1,326 @@
+# Shared data-loading layer for the dashboard's Google Sheets feeds.
+#
+# Streamlit reruns main_gb.py on every widget interaction, so reading the
+# published CSVs at module level re-downloads them on each click. The frames
+# are kept here instead, once per process, shared by every session and
+# expired after a configurable TTL.
+#
+# A cold process starts from the local snapshot store (see snapshots.py) when
+# one exists and revalidates against the sheet in the background, so the page
+# renders without waiting on the network and keeps working when it is down.
+#
+# New versions are validated against schema.py once, when they are fetched.
+# A version that fails is quarantined and the last good one keeps being
+# served, status() reports the health of every dataset.
+#
+# A dataset's version is the content hash of the CSV it was parsed from, so
+# re-fetching an unchanged sheet keeps every memoized table derived from it
+# (see derived.py), and on_change() listeners hear only about real changes.
+#
+# With GB_ISSUES set, the bond and issuer datasets are rolled up from
+# issue-level records instead of fetched (see issues.py), a refresh then
+# reads only the records added since.
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from green_bonds import instrument, issues, schema, snapshots, store
+
+log = logging.getLogger(__name__)
+
+# Published sheet URLs
+SOURCES = {
+    # Type of Issuer
+    'issuer': 'https://docs.google.com/spreadsheets/d/e/2PACX-1vQ3FXcBVHwZ7e4ynMx8ptDEmR2UoiAcjxiJIf4lj-NJk1GdAXzvMt6vENKNW9hRnUZ34cKtcyoedA2C/pub?gid=193532952&single=true&output=csv',
+    # Green Bonds Issuance per Country
+    'bond': 'https://docs.google.com/spreadsheets/d/e/2PACX-1vS9E4_uHhawLaAkcSPxbilVAbxYjmZ8W0-5hP5lmuaMimayMH9QMej2CQbTL46tv0Cy1mneKkS00Cw_/pub?gid=2046901806&single=true&output=csv',
+    # Green Bonds Issuance per Region
+    'region': 'https://docs.google.com/spreadsheets/d/e/2PACX-1vRc9gb_MCustazRQfq8Ue5AB-Ko8BKCpXJFCBVZXJUrziR--zeLgCuGR9ifvkwYCe8g1H4lfp3kA01c/pub?gid=731874032&single=true&output=csv',
+    # Cumulative Green Bond Issuances by Use of Proceeds
+    'use': 'https://docs.google.com/spreadsheets/d/e/2PACX-1vSLqvhg_bECvhbg9yLA7NoGX9VLOZNTMQcguN4jUtN3NHiCyI3weK2MQVLewEE-ghKeBJNDb8mvuI99/pub?gid=187166788&single=true&output=csv',
+    # Environmental Protection Expenditures
+    'expenditure': 'https://docs.google.com/spreadsheets/d/e/2PACX-1vTdVY5KdcjHeaYhhpeVVeNnhqI7YVd-UlIs88oWtulNJsnzdtFdpZQuN32zW_4fxtLRbTUpS7qaf5JZ/pub?gid=402589920&single=true&output=csv',
+    # Gross Domestic Product in billion US dollars, Country and one column per
+    # year. There is no published sheet yet, set GB_GDP_URL to enable it
+    'gdp': os.environ.get('GB_GDP_URL'),
+}
+
+# Seconds a loaded dataset stays fresh, override with GB_DATA_TTL
+DEFAULT_TTL = float(os.environ.get('GB_DATA_TTL', 3600))
+
+# Per-source fetch timeouts in seconds, default GB_FETCH_TIMEOUT
+FETCH_TIMEOUT = float(os.environ.get('GB_FETCH_TIMEOUT', 15))
+TIMEOUTS = {name: FETCH_TIMEOUT for name in SOURCES}
+
+# Seconds before a dataset that failed to load is tried again
+RETRY_AFTER = float(os.environ.get('GB_RETRY_AFTER', 60))
+
+# Serve every dataset as {GB_SOURCE_BASE_URL}/{name}.csv instead, e.g. from a
+# local file server standing in for Google in tests
+SOURCE_BASE_URL = os.environ.get('GB_SOURCE_BASE_URL')
+
+
+def source_url(name):
+    if SOURCE_BASE_URL:
+        return f"{SOURCE_BASE_URL.rstrip('/')}/{name}.csv"
+    return SOURCES[name]
+
+
+def configured(name):
+    """Whether `name` has a source to load from."""
+    return bool(source_url(name))
+
+
+class Dataset:
+    """A loaded source frame tagged with the version it was loaded as.
+
+    Datasets hash and compare by (name, version), so they can be passed to
+    memoized functions that derive tables from them. `frame` is a
+    copy-on-write view of the shared frame, see store.py.
+    """
+
+    def __init__(self, name, frame, version, loaded_at):
+        self.name = name
+        self._frame = frame
+        self.version = version
+        self.loaded_at = loaded_at
+
+    @property
+    def frame(self):
+        return store.view(self._frame)
+
+    def __hash__(self):
+        return hash((self.name, self.version))
+
+    def __eq__(self, other):
+        if not isinstance(other, Dataset):
+            return NotImplemented
+        return (self.name, self.version) == (other.name, other.version)
+
+    def __repr__(self):
+        return f'Dataset({self.name!r}, version={self.version!r}, rows={len(self._frame)})'
+
+
+class Unavailable(Exception):
+    """A dataset could not be fetched and there is no cached or snapshot copy."""
+
+    def __init__(self, name):
+        super().__init__(f'Dataset {name!r} is unavailable')
+        self.name = name
+
+
+_cache = {}
+_checked = {}  # name -> time the source was last checked
+_failed = {}  # name -> time of the last failed foreground fetch
+_versions = {}
+_health = {}  # name -> source, load time and last error of the last attempt
+_pending = set()  # (name, task) queued or running in the pool
+_listeners = []  # called with the name of every dataset whose content changed
+_lock = threading.Lock()
+_locks = {name: threading.Lock() for name in SOURCES}  # one foreground fetch per dataset
+
+# Fetches run here, all sources download concurrently
+_pool = ThreadPoolExecutor(max_workers=len(SOURCES), thread_name_prefix='gb-fetch')
+
+
+def _version(name, digest):
+    if digest:
+        return digest[:12]
+    # Snapshots written before content hashes, or without a snapshot store
+    _versions[name] = _versions.get(name, 0) + 1
+    return str(_versions[name])
+
+
+def _store(name, snapshot, checked_at, source):
+    frame = snapshot.frame
+    if snapshot.report is None:
+        # Stored before snapshots kept their schema report, typed here once
+        frame = schema.apply(name, frame)
+    else:
+        schema.record(name, snapshot.report)
+    dataset = Dataset(name, frame, _version(name, snapshot.digest), time.time())
+    _cache[name] = dataset
+    _checked[name] = checked_at
+    _health.setdefault(name, {})['source'] = source
+    instrument.gauge('gb_dataset_bytes', int(frame.memory_usage(deep=True).sum()), dataset=name)
+    instrument.gauge('gb_dataset_rows', len(frame), dataset=name)
+    return dataset
+
+
+def _revalidate(name, force=False):
+    start = time.perf_counter()
+    source = 'issues' if issues.provides(name) else 'network'
+    try:
+        if source == 'issues':
+            snapshot, changed = issues.revalidate(name)
+        else:
+            snapshot, changed = snapshots.revalidate(name, source_url(name), timeout=TIMEOUTS[name], force=force)
+        # An unchanged source hands back the stored snapshot, which may predate the schema
+        schema.check(name, snapshot.frame)
+    except Exception as e:
+        with _lock:
+            _health.setdefault(name, {}).update(last_error=f'{type(e).__name__}: {e}', last_error_at=time.time())
+        raise
+    seconds = time.perf_counter() - start
+    instrument.observe('gb_dataset_load_seconds', seconds, dataset=name, source=source)
+    with _lock:
+        _failed.pop(name, None)
+        _health.setdefault(name, {}).update(load_seconds=seconds, last_error=None)
+        current = _cache.get(name)
+        if current is not None and (not changed or (snapshot.digest and current.version == snapshot.digest[:12])):
+            _checked[name] = time.time()
+            return current
+        dataset = _store(name, snapshot, time.time(), source)
+    if current is not None:
+        for listener in list(_listeners):
+            try:
+                listener(name)
+            except Exception:
+                log.warning('Change listener of %r failed', name, exc_info=True)
+    return dataset
+
+
+def on_change(listener):
+    """Call `listener(name)` whenever a refresh brings new content for dataset `name`.
+
+    Registering the same listener again has no effect.
+    """
+    with _lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+
+def _submit(name, task):
+    with _lock:
+        if (name, task) in _pending:
+            return
+        _pending.add((name, task))
+
+    def run():
+        try:
+            task(name)
+        except Unavailable:
+            pass
+        except Exception:
+            # Keep serving what we have, the next stale access retries
+            log.warning('Background refresh of %r failed', name, exc_info=True)
+            with _lock:
+                _checked[name] = time.time()
+        finally:
+            with _lock:
+                _pending.discard((name, task))
+
+    _pool.submit(run)
+
+
+def get(name, ttl=None):
+    """Return the cached Dataset for `name`.
+
+    A stale dataset is returned as is while it is revalidated in the
+    background. Without any cached copy the local snapshot is served, and
+    only when there is no snapshot either does this block on the network.
+    Raises Unavailable when that fetch fails, further calls fail fast for
+    RETRY_AFTER seconds.
+    """
+    if name not in SOURCES:
+        raise KeyError(f'Unknown dataset {name!r}, expected one of {sorted(SOURCES)}')
+    if not configured(name):
+        raise Unavailable(name)
+    ttl = DEFAULT_TTL if ttl is None else ttl
+
+    dataset = _cache.get(name)
+    instrument.count('gb_dataset_requests_total', dataset=name, result='hit' if dataset else 'miss')
+    if dataset is None:
+        # Waits for a fetch of the same dataset already in flight (e.g. from
+        # prefetch), other datasets are not blocked
+        with _locks[name]:
+            dataset = _cache.get(name)
+            if dataset is None:
+                if time.time() - _failed.get(name, 0) < RETRY_AFTER:
+                    raise Unavailable(name)
+                start = time.perf_counter()
+                snapshot = snapshots.read(name)
+                if snapshot is not None:
+                    instrument.observe('gb_dataset_load_seconds', time.perf_counter() - start, dataset=name, source='snapshot')
+                force = False
+                if snapshot is not None and schema.problems(name, snapshot.frame):
+                    # Written before the current schema, refetch it unconditionally instead
+                    log.warning('Ignoring snapshot of %r, it no longer validates', name)
+                    snapshot, force = None, True
+                if snapshot is not None:
+                    with _lock:
+                        dataset = _store(name, snapshot, snapshot.fetched_at or 0, 'snapshot')
+                else:
+                    try:
+                        return _revalidate(name, force)
+                    except Exception as e:
+                        log.warning('Fetching %r failed', name, exc_info=True)
+                        _failed[name] = time.time()
+                        raise Unavailable(name) from e
+
+    if time.time() - _checked.get(name, 0) >= ttl:
+        _submit(name, _revalidate)
+    return dataset
+
+
+def load(name, ttl=None):
+    """Return a copy-on-write view of the shared DataFrame for `name`."""
+    return get(name, ttl).frame
+
+
+def prefetch(names=None):
+    """Start loading every dataset not in memory yet, without waiting.
+
+    Called at the top of the page, so all sources download concurrently and
+    each section only waits for its own data in get().
+    """
+    for name in names or SOURCES:
+        if name not in _cache and configured(name):
+            _submit(name, get)
+
+
+def status():
+    """One record per configured dataset: rows, version, timings and last error.
+
+    `last_error` is set while the source's latest version is rejected or
+    can't be fetched, the dataset keeps serving the version it has.
+    """
+    rows = []
+    with _lock:
+        for name in SOURCES:
+            if not configured(name):
+                continue
+            dataset = _cache.get(name)
+            health = _health.get(name, {})
+            rows.append({
+                'name': name,
+                'rows': len(dataset.frame) if dataset else None,
+                'version': dataset.version if dataset else None,
+                'source': health.get('source'),
+                'loaded_at': dataset.loaded_at if dataset else None,
+                'last_checked': _checked.get(name),
+                'load_seconds': health.get('load_seconds'),
+                'last_error': health.get('last_error'),
+                'last_error_at': health.get('last_error_at'),
+                'quarantined': len(snapshots.quarantined(name)),
+            })
+    return rows
+
+
+def refresh(name=None):
+    """Revalidate `name` (or every dataset) against its source right away.
+
+    Datasets are fetched concurrently. Returns the names that could not be
+    refreshed, those keep serving their cached or snapshot copy.
+    """
+    def attempt(key):
+        try:
+            _revalidate(key)
+        except Exception:
+            log.warning('Refresh of %r failed', key, exc_info=True)
+            return key
+
+    names = [name] if name else [key for key in SOURCES if configured(key)]
+    return [key for key in _pool.map(attempt, names) if key]
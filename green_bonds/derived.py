@@ -0,0 +1,58 @@
+# Dependency graph of the derived tables.
+#
+# Every derived table is a memoized function of the Datasets it is built from
+# (tidy.py, metrics.py, gdp.py, charts.py), and a Dataset's version is the
+# content hash of its CSV (see data.py). Re-fetching an unchanged sheet keeps
+# the version, so everything downstream keeps hitting its cache; a changed
+# sheet gets a new version, and only the tables that read it miss.
+#
+# NODES declares each table's inputs, so rebuild() can recompute exactly the
+# tables downstream of a change as soon as it is fetched, instead of the next
+# visitor paying for it:
+#
+#     data.on_change(derived.rebuild)
+from green_bonds import charts, data, gdp, instrument, metrics, tidy
+
+# name -> (function, datasets it reads), inputs before the tables built on them
+NODES = {
+    'issuer_long': (tidy.issuer_long, ('issuer',)),
+    'yearly_totals': (metrics.yearly_totals, ('issuer',)),
+    'issuer_shares': (metrics.issuer_shares, ('issuer',)),
+    'issuer_share_spec': (charts.issuer_share_spec, ('issuer',)),
+    'bond_long': (tidy.bond_long, ('bond',)),
+    'bond_regions': (tidy.bond_regions, ('bond',)),
+    'region_totals': (metrics.region_totals, ('region',)),
+    'category_stats': (metrics.category_stats, ('use',)),
+    'category_usage': (metrics.category_usage, ('use',)),
+    'category_counts': (metrics.category_counts, ('use',)),
+    'amount_counts': (metrics.amount_counts, ('use',)),
+    'category_pie_spec': (charts.category_pie_spec, ('use',)),
+    'expenditure_long': (tidy.expenditure_long, ('expenditure',)),
+    'expenditure_cube': (tidy.expenditure_cube, ('expenditure',)),
+    'expenditure_index': (tidy.expenditure_index, ('expenditure',)),
+    'expenditure_countries': (tidy.expenditure_countries, ('expenditure',)),
+    'gdp_countries': (gdp.countries, ('gdp',)),
+}
+
+
+def downstream(*names):
+    """Nodes reading any of the datasets `names`, in build order."""
+    return [node for node, (_, inputs) in NODES.items() if set(inputs) & set(names)]
+
+
+def rebuild(*names):
+    """Recompute the nodes downstream of the datasets `names`, returns the ones built.
+
+    Nodes with an input that can't be loaded are skipped.
+    """
+    built = []
+    for node in downstream(*names):
+        function, inputs = NODES[node]
+        try:
+            datasets = [data.get(name) for name in inputs]
+        except data.Unavailable:
+            continue
+        with instrument.stage(f'derived.{node}'):
+            function(*datasets)
+        built.append(node)
+    return built
@@ -0,0 +1,210 @@
+# Static export of every chart variant, without the Streamlit UI.
+#
+# Renders each chart of the dashboard to Vega-Lite JSON, and to SVG/PNG when
+# vl-convert is installed (`pip install vl-convert-python`), next to an
+# index.html linking them all:
+#
+#     python -m green_bonds.export --out export
+#     python -m green_bonds.export --out export --formats json svg --jobs 8
+#
+# Charts are built by the same memoized functions the page uses (charts.py).
+# They are spread over a process pool that receives the loaded frames once
+# per worker, and every file is written as soon as its chart is done.
+import argparse
+import concurrent.futures
+import html
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import re
+import time
+
+from green_bonds import charts, data, gdp, metrics, tidy
+
+try:
+    import vl_convert
+except ImportError:
+    vl_convert = None
+
+log = logging.getLogger(__name__)
+
+FORMATS = ('json', 'svg', 'png')
+
+# Datasets the exported charts are built from, gdp only when it has a source
+NAMES = ('issuer', 'bond', 'use', 'expenditure', 'gdp')
+
+
+def _slug(value):
+    return re.sub(r'[^a-z0-9]+', '-', str(value).lower()).strip('-') or 'chart'
+
+
+def variants(datasets):
+    """Every chart of the dashboard for the loaded `datasets` ({name: Dataset}).
+
+    Yields dicts with the index `section` and `title`, the file `stem` and
+    the `chart` function of charts.py with its `datasets` names and `args`.
+    """
+    stems = set()
+
+    def job(section, title, stem, chart, names, *args):
+        stem = base = _slug(stem)
+        suffix = 1
+        while stem in stems:
+            suffix += 1
+            stem = f'{base}-{suffix}'
+        stems.add(stem)
+        return {'section': section, 'title': title, 'stem': stem, 'chart': chart, 'datasets': names, 'args': args}
+
+    if 'issuer' in datasets:
+        issuer = datasets['issuer']
+        yield job('Overview', 'Sum of Green Bonds Issuance by Year', 'yearly-total', 'yearly_total_spec', ('issuer',))
+        yield job('Type of Issuer', 'Share of Each Type of Issuer by Year', 'issuer-all-years', 'issuer_share_spec', ('issuer',))
+        for year in tidy.years(issuer):
+            yield job('Type of Issuer', f'Pie Chart for {year}', f'issuer-pie-{year}', 'issuer_pie_spec', ('issuer',), year)
+            yield job('Type of Issuer', f'Value Comparison for {year}', f'issuer-dot-{year}', 'issuer_dot_spec', ('issuer',), year)
+
+    if 'bond' in datasets:
+        bond = datasets['bond']
+        for year in tidy.years(bond):
+            for continent in ['All', *tidy.bond_regions(bond)]:
+                yield job('Participation by Region', f'{continent}, {year}', f'country-{year}-{continent}', 'country_bar_spec', ('bond',), year, continent)
+
+    if 'use' in datasets:
+        yield job('Use of Proceeds', 'Use of Green Bond by Category', 'category-pie', 'category_pie_spec', ('use',))
+        for category in metrics.category_stats(datasets['use']).index:
+            yield job('Use of Proceeds', category, f'category-{category}', 'category_bar_spec', ('use',), category)
+
+    if 'expenditure' in datasets:
+        for country in tidy.expenditure_countries(datasets['expenditure']):
+            yield job('Environmental Protection Expenditures', country, f'expenditure-{country}', 'expenditure_spec', ('expenditure',), country)
+
+    if {'gdp', 'bond', 'expenditure'} <= set(datasets):
+        # The countries the page selects by default
+        countries = gdp.countries(datasets['gdp'])[:3]
+        for label, field, title in charts.GDP_VIEWS:
+            yield job('Gross Domestic Product', f"{title}, {', '.join(countries)}", f'gdp-{field}', 'gdp_spec',
+                      ('gdp', 'bond', 'expenditure'), countries, field, title)
+
+
+_datasets = {}
+
+
+def _init(loaded):
+    # Worker initializer, `loaded` is {name: (frame, version)} sent once per process.
+    # Exported specs are standalone files, so their data stays inline JSON
+    charts.CHART_DATA = 'json'
+    for name, (frame, version) in loaded.items():
+        _datasets[name] = data.Dataset(name, frame, version, time.time())
+
+
+def _write(path, content):
+    tmp = path.with_name(path.name + '.tmp')
+    if isinstance(content, str):
+        tmp.write_text(content)
+    else:
+        tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def render(variant, directory, formats):
+    """Build one chart and write it in `formats`, returns the written file names."""
+    function = getattr(charts, variant['chart'])
+    spec = function(*[_datasets[name] for name in variant['datasets']], *variant['args'])
+    directory = pathlib.Path(directory)
+    files = []
+    for fmt in formats:
+        path = directory / f"{variant['stem']}.{fmt}"
+        if fmt == 'json':
+            _write(path, json.dumps(spec))
+        elif fmt == 'svg':
+            _write(path, vl_convert.vegalite_to_svg(spec))
+        elif fmt == 'png':
+            _write(path, vl_convert.vegalite_to_png(spec, scale=2))
+        files.append(path.name)
+    return files
+
+
+def write_index(directory, rendered):
+    """Write index.html listing the `rendered` [(variant, files)] by section."""
+    sections = {}
+    for variant, files in rendered:
+        sections.setdefault(variant['section'], []).append((variant, files))
+
+    parts = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>Green Economy Dashboard charts</title>',
+             '<style>body{font-family:sans-serif;margin:2em}figure{display:inline-block;margin:1em;vertical-align:top}'
+             'img{max-width:480px;display:block}</style></head><body>',
+             '<h1>🌿 Green Economy Dashboard charts</h1>']
+    for section, items in sections.items():
+        parts.append(f'<h2>{html.escape(section)}</h2>')
+        for variant, files in items:
+            image = next((name for name in files if name.endswith(('.svg', '.png'))), None)
+            links = ' '.join(f'<a href="{html.escape(name)}">{name.rsplit(".", 1)[1]}</a>' for name in files)
+            parts.append('<figure>')
+            if image:
+                parts.append(f'<img src="{html.escape(image)}" alt="{html.escape(variant["title"])}" loading="lazy">')
+            parts.append(f'<figcaption>{html.escape(variant["title"])} ({links})</figcaption></figure>')
+    parts.append('</body></html>')
+    _write(pathlib.Path(directory) / 'index.html', '\n'.join(parts))
+
+
+def export(directory, formats=('json',), jobs=None, names=NAMES):
+    """Render every chart variant to `directory`, returns the number of failures."""
+    if set(formats) - {'json'} and vl_convert is None:
+        raise RuntimeError('SVG/PNG export needs vl-convert, install it with `pip install vl-convert-python`')
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    loaded = {}
+    for name in names:
+        if not data.configured(name):
+            continue
+        try:
+            loaded[name] = data.get(name)
+        except data.Unavailable:
+            log.warning('Skipping the charts of %r, it is unavailable', name)
+    todo = list(variants(loaded))
+
+    rendered, failed = [], 0
+    # spawn, the parent has fetch threads running that a fork would copy mid-flight
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init,
+        initargs=({name: (dataset.frame, dataset.version) for name, dataset in loaded.items()},),
+    ) as pool:
+        futures = {pool.submit(render, variant, directory, formats): variant for variant in todo}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            variant = futures[future]
+            try:
+                rendered.append((variant, future.result()))
+            except Exception:
+                failed += 1
+                log.warning('Exporting %s failed', variant['stem'], exc_info=True)
+            print(f"[{done}/{len(todo)}] {variant['stem']}", flush=True)
+
+    order = {variant['stem']: i for i, variant in enumerate(todo)}
+    write_index(directory, sorted(rendered, key=lambda item: order[item[0]['stem']]))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m green_bonds.export', description='Export every dashboard chart.')
+    parser.add_argument('--out', default='export', help='output directory (default export)')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=None,
+                        help='formats to write (default json, plus svg when vl-convert is installed)')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default one per core)')
+    args = parser.parse_args(argv)
+
+    formats = args.formats or (['json', 'svg'] if vl_convert else ['json'])
+    try:
+        failed = export(args.out, formats, args.jobs)
+    except RuntimeError as e:
+        parser.error(str(e))
+    print(f"Wrote {pathlib.Path(args.out) / 'index.html'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
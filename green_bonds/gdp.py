@@ -0,0 +1,110 @@
+# Green bonds and environmental expenditures relative to GDP.
+#
+# The GDP sheet is joined with the bond and expenditure sheets on (Country,
+# Year) for the countries the GDP section selects, once per data version and
+# selection. Only the rows of those countries are melted. The sheets spell
+# countries differently ("Korea, Rep. of", "China (Mainland)", ...), so they
+# are joined on normalized country keys.
+import functools
+import re
+import unicodedata
+
+import pandas as pd
+
+from green_bonds import instrument, store, tidy
+
+# Indicator of the expenditure sheet holding total environmental protection spending
+TOTAL_EXPENDITURE = 'Expenditure on environment protection'
+
+# Normalized spellings that name the same country
+ALIASES = {
+    'china mainland': 'china',
+    'china p r mainland': 'china',
+    'hong kong sar china': 'hong kong',
+    'china p r hong kong': 'hong kong',
+    'korea rep of': 'korea',
+    'korea rep': 'korea',
+    'republic of korea': 'korea',
+    'south korea': 'korea',
+    'united states of america': 'united states',
+    'russian federation': 'russia',
+    'turkiye': 'turkey',
+    'turkiye rep of': 'turkey',
+    'netherlands the': 'netherlands',
+    'czech rep': 'czech republic',
+    'czechia': 'czech republic',
+    'slovak rep': 'slovak republic',
+    'slovakia': 'slovak republic',
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_country(name):
+    """Join key of a country name, e.g. 'Korea, Rep. of' -> 'korea'."""
+    key = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode()
+    key = re.sub(r'[^a-z0-9]+', ' ', key.lower()).strip()
+    return ALIASES.get(key, key)
+
+
+def _keys(countries):
+    # One normalization per distinct country, not per row
+    countries = pd.Series(countries)
+    return countries.map({country: normalize_country(country) for country in countries.dropna().unique()})
+
+
+def _rows(dataset, keys):
+    # Mask of the rows of `dataset` whose country normalizes to one of `keys`
+    countries = dataset.frame['Country']
+    names = [country for country in countries.dropna().unique() if normalize_country(country) in keys]
+    return countries.isin(names).to_numpy()
+
+
+def _long(frame, id_vars, value_name):
+    # The rows of `frame` as (id_vars, Year, value_name), non-zero values only
+    long = tidy.melt(frame, id_vars, value_name)
+    return long[long[value_name].notnull() & (long[value_name] != 0)]
+
+
+@store.shared
+@functools.lru_cache(maxsize=32)
+@instrument.timed('gdp.green_gdp')
+def green_gdp(gdp, bond, expenditure, countries):
+    """GDP joined with green bond issuance and environmental expenditure of the `countries` tuple.
+
+    One row per (Country, Year) of the GDP sheet, the countries in the given
+    order, with the columns GDP, Green Bonds (billion US dollars), Green
+    Bonds (% of GDP) and Expenditure (% of GDP). Countries keep the GDP
+    sheet's spelling. Only the rows of those countries are melted, so it is
+    built per selection rather than for the whole sheets.
+    """
+    frame = gdp.frame[gdp.frame['Country'].isin(countries)]
+    table = tidy.melt(frame, ['Country'], 'GDP')
+    table = table[table['GDP'].notnull() & (table['GDP'] > 0)]
+    table = table.assign(Key=_keys(table['Country'].astype(str)).to_numpy())
+    keys = set(table['Key'])
+
+    # Summed over every spelling of the same country
+    rows = bond.frame[_rows(bond, keys) & bond.frame['Region'].notnull().to_numpy()]
+    bonds = _long(rows, ['Country'], 'Value')
+    bonds = bonds.assign(Key=_keys(bonds['Country'].astype(str)).to_numpy())
+    bonds = bonds.groupby(['Key', 'Year'])['Value'].sum().rename('Green Bonds')
+
+    rows = expenditure.frame[_rows(expenditure, keys) & (expenditure.frame['Indicator'] == TOTAL_EXPENDITURE).to_numpy()]
+    spending = _long(rows, ['Country'], 'Expenditure')
+    spending = spending.groupby(['Country', 'Year'], observed=True)['Expenditure'].sum()
+    spending = spending[spending != 0].reset_index()
+    spending = spending.assign(Key=_keys(spending['Country'].astype(str)).to_numpy())
+    spending = spending.groupby(['Key', 'Year'])['Expenditure'].sum().rename('Expenditure (% of GDP)')
+
+    table = table.join(bonds, on=['Key', 'Year']).join(spending, on=['Key', 'Year'])
+    table['Green Bonds (% of GDP)'] = table['Green Bonds'] / table['GDP'] * 100
+    table = table.drop(columns='Key')
+    order = {country: i for i, country in enumerate(countries)}
+    table = table.assign(Order=table['Country'].astype(str).map(order).to_numpy())
+    return table.sort_values(['Order', 'Year'], kind='stable').drop(columns='Order').reset_index(drop=True)
+
+
+@functools.lru_cache(maxsize=2)
+def countries(gdp):
+    """Every country in the GDP sheet, in sheet order."""
+    return tuple(gdp.frame['Country'].dropna().unique().tolist())
@@ -0,0 +1,208 @@
+# Timings and counters of the dashboard's work, process-wide.
+#
+# Records the wall time of every page section and stage (melts, filters,
+# chart builds, spec serialization), dataset loads and their size, chart
+# payload sizes, and the hits and misses of every memoized function:
+#
+#     with instrument.stage('tidy.melt'):
+#         ...
+#
+#     @instrument.timed('section.overview')
+#     def overview_section(): ...
+#
+# Everything is readable as records(), Prometheus text (prometheus()) or JSON
+# lines (jsonl()). Set GB_METRICS_TEXTFILE (e.g. for node_exporter's textfile
+# collector) and/or GB_METRICS_JSONL to have them written every
+# GB_METRICS_INTERVAL seconds, and GB_DEBUG=1 to show them in the sidebar.
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Show the debug panel in the sidebar, also with ?debug=1 in the page URL
+DEBUG = os.environ.get('GB_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# Files the metrics are written to, and how often in seconds
+TEXTFILE = os.environ.get('GB_METRICS_TEXTFILE')
+JSONL = os.environ.get('GB_METRICS_JSONL')
+INTERVAL = float(os.environ.get('GB_METRICS_INTERVAL', 15))
+
+_summaries = {}  # (metric, labels) -> [count, sum, max]
+_counters = {}
+_gauges = {}
+_lock = threading.Lock()
+_exporter = None
+
+
+def _key(metric, labels):
+    return metric, tuple(sorted(labels.items()))
+
+
+def observe(metric, value, **labels):
+    """Add one `value` (e.g. seconds or bytes) to the summary `metric`."""
+    key = _key(metric, labels)
+    with _lock:
+        entry = _summaries.get(key)
+        if entry is None:
+            _summaries[key] = [1, value, value]
+        else:
+            entry[0] += 1
+            entry[1] += value
+            entry[2] = max(entry[2], value)
+
+
+def count(metric, value=1, **labels):
+    """Increase the counter `metric` by `value`."""
+    key = _key(metric, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge(metric, value, **labels):
+    """Set the gauge `metric` to `value`."""
+    with _lock:
+        _gauges[_key(metric, labels)] = value
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time the block as stage `name` (gb_stage_seconds)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('gb_stage_seconds', time.perf_counter() - start, stage=name)
+
+
+def timed(name):
+    """Decorator timing every call as stage `name`.
+
+    Put it under functools.lru_cache to time only the calls that miss.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def caches():
+    """{module.function: lru_cache info} of every memoized function of the package."""
+    from green_bonds import charts, gdp, metrics, query, tidy
+
+    found = {}
+    for module in (tidy, metrics, gdp, query, charts):
+        prefix = module.__name__.rsplit('.', 1)[-1]
+        for name, value in vars(module).items():
+            if callable(getattr(value, 'cache_info', None)):
+                found[f'{prefix}.{name}'] = value.cache_info()
+    return found
+
+
+def records():
+    """Every metric as a dict with `metric`, `type` and `labels`.
+
+    Summaries carry `count`, `sum` and `max`, counters and gauges `value`.
+    Cache statistics are read from the memoized functions at call time.
+    """
+    with _lock:
+        summaries = {key: list(entry) for key, entry in _summaries.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    for function, info in caches().items():
+        counters[_key('gb_cache_hits_total', {'function': function})] = info.hits
+        counters[_key('gb_cache_misses_total', {'function': function})] = info.misses
+        gauges[_key('gb_cache_entries', {'function': function})] = info.currsize
+
+    found = []
+    for (metric, labels), (calls, total, peak) in sorted(summaries.items()):
+        found.append({'metric': metric, 'type': 'summary', 'labels': dict(labels), 'count': calls, 'sum': total, 'max': peak})
+    for kind, values in (('counter', counters), ('gauge', gauges)):
+        for (metric, labels), value in sorted(values.items()):
+            found.append({'metric': metric, 'type': kind, 'labels': dict(labels), 'value': value})
+    return found
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _value(value):
+    return f'{value:g}' if isinstance(value, float) else str(value)
+
+
+def prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    lines, typed = [], set()
+
+    def declare(metric, kind):
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f'# TYPE {metric} {kind}')
+
+    # Exposition wants every sample of a metric together
+    found = records()
+    for record in found:
+        metric, labels = record['metric'], _labels(record['labels'])
+        declare(metric, record['type'])
+        if record['type'] == 'summary':
+            lines.append(f"{metric}_count{labels} {record['count']}")
+            lines.append(f"{metric}_sum{labels} {_value(record['sum'])}")
+        else:
+            lines.append(f"{metric}{labels} {_value(record['value'])}")
+    for record in found:
+        if record['type'] == 'summary':
+            declare(record['metric'] + '_max', 'gauge')
+            lines.append(f"{record['metric']}_max{_labels(record['labels'])} {_value(record['max'])}")
+    return '\n'.join(lines) + '\n'
+
+
+def jsonl():
+    """All metrics as JSON lines, each stamped with the current time."""
+    now = time.time()
+    return ''.join(json.dumps({'time': now, **record}) + '\n' for record in records())
+
+
+def reset():
+    """Forget every recorded timing, counter and gauge."""
+    with _lock:
+        _summaries.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def _export():
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            if TEXTFILE:
+                tmp = f'{TEXTFILE}.tmp'
+                with open(tmp, 'w') as f:
+                    f.write(prometheus())
+                os.replace(tmp, TEXTFILE)
+            if JSONL:
+                with open(JSONL, 'a') as f:
+                    f.write(jsonl())
+        except OSError:
+            log.warning('Writing metrics failed', exc_info=True)
+
+
+def start_exporter():
+    """Write the metrics to GB_METRICS_TEXTFILE / GB_METRICS_JSONL in the background, once per process."""
+    global _exporter
+    if not (TEXTFILE or JSONL):
+        return
+    with _lock:
+        if _exporter is None:
+            _exporter = threading.Thread(target=_export, name='gb-metrics', daemon=True)
+            _exporter.start()
@@ -0,0 +1,420 @@
+# Issue-level green bond records, rolled up in a streaming pass.
+#
+# The bond, issuer and region sheets are small pre-aggregated Country x Year,
+# Issuer x Year and Region x Year tables, the use sheet lists projects by use
+# of proceeds. Set GB_ISSUES to a glob of raw issue files instead (CSV or
+# Parquet, one row per bond) and all four are built from those records, so
+# the region totals and the country bars agree:
+#
+#     GB_ISSUES='/data/issues/*.csv' streamlit run main_gb.py
+#     python -m green_bonds.issues ingest
+#
+# Files are read GB_ISSUES_CHUNK_ROWS rows at a time and every chunk is
+# folded into running Country x Year and Issuer x Year sums and per
+# Category and size class totals, counts and extremes, so memory is bounded by the chunk and the number of groups, not by the rows.
+# The roll-ups are kept next to the snapshots with how far each file has been
+# read. A later scan only reads new files and the lines appended to a CSV
+# since, files are expected to be append-only. A file that shrank, changed
+# its first bytes or disappeared can't be subtracted, the roll-ups are then
+# rebuilt from every file.
+#
+# The roll-ups are served in the layout of the sheets they replace (see
+# bond(), issuer(), region() and use()), so tidy.py, metrics.py and charts.py
+# read them as they are, and each new batch is a new dataset version (see
+# data.py).
+import argparse
+import csv
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import pathlib
+import threading
+
+import pandas as pd
+
+from green_bonds import instrument, schema, snapshots
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+log = logging.getLogger(__name__)
+
+# Glob of the issue files, unset to use the sheets
+ISSUES = os.environ.get('GB_ISSUES')
+
+# Rows read per chunk, override with GB_ISSUES_CHUNK_ROWS
+CHUNK_ROWS = int(os.environ.get('GB_ISSUES_CHUNK_ROWS', 500_000))
+
+# Columns read from an issue file, others are ignored. Date is the issue date,
+# Amount is in US dollars and Category the use of proceeds
+COLUMNS = ['Type_of_Issuer', 'Country', 'Region', 'Date', 'Amount', 'Category']
+LABELS = ['Type_of_Issuer', 'Country', 'Region', 'Category']
+
+# The sheets are in billions of US dollars
+UNIT = 1e9
+
+# Size classes of the use sheet's Amount column, by upper bound in billions
+SIZES = [
+    (0.1, 'Less Than 100 Millions'),
+    (1, 'Less Than 1 Billions'),
+    (10, 'One to 10 Billions'),
+    (100, 'Ten to 100 Billions'),
+    (float('inf'), 'More than 100 Billions'),
+]
+
+# Bytes of a CSV's head compared between scans to notice a rewritten file
+HEAD_BYTES = 1 << 20
+
+_rollups = None
+_saved = []  # digest of the tables this process saved last
+_lock = threading.Lock()
+
+
+def enabled():
+    return bool(ISSUES)
+
+
+def provides(name):
+    """Whether dataset `name` is built from the issue files."""
+    return enabled() and name in SHEETS
+
+
+def paths():
+    """The issue files, sorted."""
+    return sorted(glob.glob(os.path.expanduser(ISSUES))) if ISSUES else []
+
+
+def _combine(total, part, how='sum'):
+    if total is None or total.empty:
+        return part
+    return pd.concat([total, part]).groupby(level=list(range(part.index.nlevels)), observed=True).agg(how)
+
+
+class Rollups:
+    """Running sums of the issue records read so far, with each file's read position."""
+
+    def __init__(self, country_year=None, issuer_year=None, category=None, files=None):
+        self.country_year = country_year  # billions per (Country, Region, Year)
+        self.issuer_year = issuer_year  # billions per (Type_of_Issuer, Year)
+        self.category = category  # Value, Maximum, Minimum (billions) and Count per (Category, Size)
+        self.files = files or {}
+
+    @property
+    def digest(self):
+        """Content hash of what has been read, changes with every batch."""
+        return hashlib.sha256(json.dumps(self.files, sort_keys=True).encode()).hexdigest()
+
+    def add(self, chunk):
+        """Fold one chunk of prepared records (see prepare()) into the sums."""
+        amount = chunk.groupby(['Country', 'Region', 'Year'], observed=True)['Amount'].sum()
+        self.country_year = _combine(self.country_year, amount)
+        amount = chunk.groupby(['Type_of_Issuer', 'Year'], observed=True)['Amount'].sum()
+        self.issuer_year = _combine(self.issuer_year, amount)
+        bounds = [-float('inf')] + [bound for bound, _ in SIZES]
+        size = pd.cut(chunk['Amount'], bounds, right=False, labels=[label for _, label in SIZES]).rename('Size')
+        stats = chunk.groupby(['Category', size], observed=True)['Amount'].agg(
+            Value='sum', Count='count', Maximum='max', Minimum='min',
+        )
+        self.category = _combine(self.category, stats, {'Value': 'sum', 'Count': 'sum', 'Maximum': 'max', 'Minimum': 'min'})
+
+    def bond(self):
+        """Country, Region and one column of billions per year, like the bond sheet."""
+        return _wide(self.country_year)
+
+    def issuer(self):
+        """Type_of_Issuer and one column of billions per year, like the issuer sheet."""
+        return _wide(self.issuer_year)
+
+    def region(self):
+        """Region and one column of billions per year, the sums of the bond() rows of each Region."""
+        if self.country_year is None:
+            return pd.DataFrame()
+        return _wide(self.country_year.groupby(level=['Region', 'Year'], observed=True).sum())
+
+    def use(self):
+        """Category, Use_of_Proceed, Value and Amount like the use sheet, one row per Category and size class.
+
+        Rolled up rather than one row per project: Value is the billions of
+        the class, Use_of_Proceed and Amount name the class, and Count,
+        Maximum and Minimum describe the issues in it (see metrics.py).
+        """
+        if self.category is None:
+            return pd.DataFrame()
+        frame = self.category.reset_index()
+        return pd.DataFrame({
+            'Category': frame['Category'],
+            'Use_of_Proceed': frame['Size'],
+            'Value': frame['Value'],
+            'Amount': frame['Size'],
+            'Count': frame['Count'],
+            'Maximum': frame['Maximum'],
+            'Minimum': frame['Minimum'],
+        })
+
+
+def _wide(amounts):
+    if amounts is None:
+        return pd.DataFrame()
+    wide = amounts.unstack('Year')
+    wide.columns = [str(year) for year in wide.columns]
+    return wide.reset_index()
+
+
+SHEETS = {'bond': Rollups.bond, 'issuer': Rollups.issuer, 'region': Rollups.region, 'use': Rollups.use}
+
+
+def prepare(chunk):
+    """Issue rows with an int Year and Amount in billions, rows without either are dropped."""
+    years = pd.to_datetime(chunk['Date'], errors='coerce').dt.year
+    amounts = pd.to_numeric(chunk['Amount'], errors='coerce') / UNIT
+    valid = years.notna() & amounts.notna()
+    skipped = int((~valid).sum())
+    if skipped:
+        instrument.count('gb_issue_rows_total', skipped, result='skipped')
+    instrument.count('gb_issue_rows_total', int(valid.sum()), result='added')
+    return chunk[LABELS].assign(Year=years.astype('Int16'), Amount=amounts)[valid]
+
+
+class _Window(io.RawIOBase):
+    # Bytes [start, stop) of an open file
+    def __init__(self, f, start, stop):
+        f.seek(start)
+        self._f = f
+        self._left = stop - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)[:self._left]
+        read = self._f.readinto(view)
+        self._left -= read
+        return read
+
+
+def _complete(f, size):
+    # Offset just past the last newline, a half-written last line waits for the next scan
+    position = size
+    while position > 0:
+        step = min(1 << 16, position)
+        f.seek(position - step)
+        found = f.read(step).rfind(b'\n')
+        if found >= 0:
+            return position - step + found + 1
+        position -= step
+    return 0
+
+
+def _head(path, length):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(min(length, HEAD_BYTES))).hexdigest()
+
+
+def _check_columns(path, columns):
+    missing = [column for column in COLUMNS if column not in columns]
+    if missing:
+        raise schema.SchemaError('issues', [f"{path} is missing columns {', '.join(map(repr, missing))}"])
+
+
+def _csv_chunks(path, state):
+    # Chunks of the lines of `path` after state['offset'], then the file's new state
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if state is None:
+            header = f.readline()
+            columns = next(csv.reader([header.decode('utf-8-sig')]))
+            _check_columns(path, columns)
+            state = {'kind': 'csv', 'columns': columns, 'offset': len(header)}
+        stop = _complete(f, size)
+        if stop > state['offset']:
+            window = io.BufferedReader(_Window(f, state['offset'], stop), buffer_size=1 << 20)
+            yield from pd.read_csv(
+                window, header=None, names=state['columns'], usecols=COLUMNS,
+                dtype={column: 'category' for column in LABELS}, chunksize=CHUNK_ROWS,
+            )
+            state = {**state, 'offset': stop}
+    yield {**state, 'head': _head(path, state['offset'])}
+
+
+def _parquet_chunks(path, state):
+    # Parquet files are written whole, they are read once
+    stat = os.stat(path)
+    if state is None:
+        if pyarrow is None:
+            raise RuntimeError(f'Reading {path} needs pyarrow, install it with `pip install pyarrow`')
+        parquet = pyarrow.parquet.ParquetFile(path)
+        _check_columns(path, parquet.schema_arrow.names)
+        for batch in parquet.iter_batches(batch_size=CHUNK_ROWS, columns=COLUMNS):
+            yield batch.to_pandas()
+    yield {'kind': 'parquet', 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def _chunks(path, state):
+    return (_parquet_chunks if str(path).endswith('.parquet') else _csv_chunks)(path, state)
+
+
+def _intact(path, state):
+    # Whether what was read from `path` is still there unchanged
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if state['kind'] == 'parquet':
+        return (stat.st_size, stat.st_mtime_ns) == (state['size'], state['mtime'])
+    return stat.st_size >= state['offset'] and _head(path, state['offset']) == state['head']
+
+
+def _dir():
+    return pathlib.Path(snapshots.SNAPSHOT_DIR) / 'issues'
+
+
+def _write_feather(frame, path):
+    tmp = snapshots.tmp_path(path)
+    try:
+        frame.to_feather(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _save(rollups):
+    # Tables first under the new digest, then the state pointing at them, so a
+    # crash in between leaves the previous roll-ups in use. Workers, the API
+    # and the ingest command may save at the same time, every file is renamed
+    # into place whole and a process only removes the tables it saved before
+    if not snapshots.enabled():
+        return
+    directory = _dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    digest = rollups.digest[:12]
+    for table in ('country_year', 'issuer_year', 'category'):
+        values = getattr(rollups, table)
+        if values is not None:
+            _write_feather(values.reset_index(), directory / f'{table}-{digest}.feather')
+    state = directory / 'state.json'
+    tmp = snapshots.tmp_path(state)
+    try:
+        tmp.write_text(json.dumps({'digest': digest, 'pattern': ISSUES, 'files': rollups.files}, indent=2))
+        os.replace(tmp, state)
+    finally:
+        tmp.unlink(missing_ok=True)
+    for previous in _saved:
+        if previous != digest:
+            for path in directory.glob(f'*-{previous}.feather'):
+                path.unlink(missing_ok=True)
+    _saved[:] = [digest]
+
+
+def _load():
+    # The saved roll-ups of the same GB_ISSUES, or empty ones
+    if not snapshots.enabled():
+        return Rollups()
+    directory = _dir()
+    try:
+        state = json.loads((directory / 'state.json').read_text())
+    except (OSError, ValueError):
+        return Rollups()
+    if state.get('pattern') != ISSUES:
+        return Rollups()
+    indexes = {
+        'country_year': ['Country', 'Region', 'Year'],
+        'issuer_year': ['Type_of_Issuer', 'Year'],
+        'category': ['Category', 'Size'],
+    }
+    tables = {}
+    try:
+        for table, index in indexes.items():
+            # Gone when another process saved newer roll-ups meanwhile, read again from the files
+            frame = pd.read_feather(directory / f"{table}-{state['digest']}.feather").set_index(index)
+            tables[table] = frame if table == 'category' else frame['Amount']
+    except Exception:
+        log.warning('Ignoring unreadable issue roll-ups in %s', directory, exc_info=True)
+        return Rollups()
+    return Rollups(files=state['files'], **tables)
+
+
+@instrument.timed('issues.ingest')
+def ingest(rebuild=False):
+    """Read what is new in the issue files into the roll-ups and return them.
+
+    Starts over from every file with `rebuild`, or when a file read before
+    is gone or was rewritten.
+    """
+    global _rollups
+    with _lock:
+        if rebuild:
+            rollups = Rollups()
+        elif _rollups is not None:
+            # A copy, so a failing file leaves the served roll-ups as they were
+            rollups = Rollups(_rollups.country_year, _rollups.issuer_year, _rollups.category, _rollups.files)
+        else:
+            rollups = _load()
+        found = paths()
+        stale = [path for path, state in rollups.files.items() if path not in found or not _intact(path, state)]
+        if stale:
+            log.info('Rebuilding the issue roll-ups, %s changed', ', '.join(stale))
+            rollups = Rollups()
+
+        digest = rollups.digest
+        files = dict(rollups.files)
+        for path in found:
+            for chunk in _chunks(path, rollups.files.get(path)):
+                if isinstance(chunk, dict):
+                    files[path] = chunk
+                else:
+                    rollups.add(prepare(chunk))
+        rollups.files = files
+        instrument.gauge('gb_issue_files', len(files))
+        if rollups.digest != digest:
+            _save(rollups)
+        _rollups = rollups
+        return rollups
+
+
+def revalidate(name):
+    """Ingest new issues and return (snapshot, changed) of dataset `name`, like snapshots.revalidate()."""
+    rollups = ingest()
+    frame = schema.apply(name, SHEETS[name](rollups))
+    report = schema.report()[name]
+    schema.check(name, frame)
+    current = snapshots.read(name)
+    if current is not None and current.digest == rollups.digest:
+        return current, False
+    return snapshots.write(name, frame, url=ISSUES, content_digest=rollups.digest, report=report), True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m green_bonds.issues', description='Roll up issue-level records.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('ingest', help='read new issues into the roll-ups')
+    run.add_argument('--rebuild', action='store_true', help='start over from every file')
+    sub.add_parser('status', help='list the issue files and how far they have been read')
+    args = parser.parse_args(argv)
+
+    if not enabled():
+        parser.error('set GB_ISSUES to a glob of issue files')
+
+    if args.command == 'ingest':
+        rollups = ingest(rebuild=args.rebuild)
+    else:
+        rollups = _load()
+    for path in paths():
+        state = rollups.files.get(path)
+        if state is None:
+            print(f'{path}: not read')
+        elif state['kind'] == 'csv':
+            print(f"{path}: read to byte {state['offset']:,} of {os.path.getsize(path):,}")
+        else:
+            print(f'{path}: read')
+    if rollups.country_year is not None:
+        print(f'{len(rollups.country_year):,} country-years, {len(rollups.issuer_year):,} issuer-years, {len(rollups.category):,} category size classes')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
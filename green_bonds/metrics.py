@@ -0,0 +1,144 @@
+# Aggregates behind the dashboard's metrics.
+#
+# Computed in one grouped pass per data version (memoized on the Dataset),
+# so the page only looks values up.
+import functools
+
+import numpy as np
+import pandas as pd
+
+from green_bonds import instrument, schema, store, tidy
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+@instrument.timed('metrics.category_stats')
+def category_stats(dataset):
+    """Total, Maximum and Minimum Value of each use-of-proceeds Category.
+
+    Indexed by Category, the largest total first.
+    """
+    frame = dataset.frame
+    if 'Count' in frame.columns:
+        # Rolled up from issues (see issues.py), the extremes are columns of their own
+        values = schema.plain_floats(frame[['Category', 'Value', 'Maximum', 'Minimum']])
+        stats = values.groupby('Category', observed=True, sort=False).agg(
+            Total=('Value', 'sum'), Maximum=('Maximum', 'max'), Minimum=('Minimum', 'min'),
+        )
+        return stats.sort_values('Total', ascending=False)
+    values = schema.plain_floats(frame[['Category', 'Value']])  # aggregate the exact values
+    stats = values.groupby('Category', observed=True, sort=False)['Value'].agg(['sum', 'max', 'min'])
+    return stats.rename(columns={'sum': 'Total', 'max': 'Maximum', 'min': 'Minimum'}).sort_values('Total', ascending=False)
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+def category_usage(dataset):
+    """Category, Usage (total Value) and Percentage of all projects' Value of every use-of-proceeds category."""
+    usage = category_stats(dataset)['Total']
+    total = schema.plain_floats(dataset.frame[['Value']])['Value'].sum()
+    return pd.DataFrame({
+        'Category': usage.index,
+        'Usage': usage.to_numpy(),
+        'Percentage': (usage / total * 100).to_numpy(),
+    })
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+def yearly_totals(dataset):
+    """Issuance summed over issuers per Year, with its Percentage Difference from the year before."""
+    values = schema.plain_floats(tidy.issuer_long(dataset)[['Value']])
+    totals = values.groupby(level='Year')['Value'].sum().to_frame()
+    totals['Percentage Difference'] = totals['Value'].pct_change() * 100
+    return totals
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+@instrument.timed('metrics.issuer_shares')
+def issuer_shares(dataset):
+    """Every issuer's share of every year, indexed by Year.
+
+    Columns Type_of_Issuer, Value, Percentage (of the year's total), Rank,
+    Value Change (% against the year before) and Share Change (percentage
+    points). Computed on the issuer x year matrix at once, the rows of each
+    year are ordered by Rank.
+    """
+    frame = dataset.frame
+    years = tidy.year_columns(frame)
+    columns = sorted(years, key=years.get)
+    values = schema.plain_floats(frame[columns]).to_numpy(dtype='float64')
+    issuers, periods = values.shape
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = values / np.nansum(values, axis=0) * 100
+        value_change = (values[:, 1:] / values[:, :-1] - 1) * 100
+    value_change = np.where(np.isfinite(value_change), value_change, np.nan)
+    value_change = np.hstack([np.full((issuers, 1), np.nan), value_change])
+    share_change = np.hstack([np.full((issuers, 1), np.nan), np.diff(shares, axis=1)])
+
+    # Largest first, missing values last
+    order = np.argsort(-np.nan_to_num(values, nan=-np.inf), axis=0, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, issuers + 1)[:, None], axis=0)
+
+    rows, cols = order.T.ravel(), np.repeat(np.arange(periods), issuers)
+    return pd.DataFrame({
+        'Year': np.array([years[column] for column in columns], dtype='int16')[cols],
+        'Type_of_Issuer': frame['Type_of_Issuer'].array.take(rows),
+        'Value': values[rows, cols],
+        'Percentage': shares[rows, cols],
+        'Rank': ranks[rows, cols].astype('int16'),
+        'Value Change': value_change[rows, cols],
+        'Share Change': share_change[rows, cols],
+    }).set_index('Year')
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+@instrument.timed('metrics.region_totals')
+def region_totals(dataset):
+    """Issuance per Region (rows) and year (int columns)."""
+    frame = dataset.frame
+    years = tidy.year_columns(frame)
+    values = schema.plain_floats(frame[['Region', *years]])  # aggregate the exact values
+    return values.groupby('Region', observed=True, sort=False)[list(years)].sum().rename(columns=years)
+
+
+@store.shared
+@functools.lru_cache(maxsize=64)
+def region_metrics(dataset, year):
+    """{Region: value} for `year`, plus the sum of every region under 'All'."""
+    totals = region_totals(dataset)
+    if year not in totals.columns:
+        return {}
+    # Sums of decimal values carry float noise (127.42999999999999), shown as is on the page
+    column = totals[year].round(10)
+    values = {region: column[region].item() for region in column.index}
+    values['All'] = round(column.sum().item(), 10)
+    return values
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+def category_counts(dataset):
+    """{Category: number of projects}."""
+    return {category: count for category, count in _projects(dataset.frame, 'Category').items()}
+
+
+def _projects(frame, column):
+    # Number of projects per value of `column`, a rolled up use sheet (see issues.py) counts them in Count
+    if 'Count' in frame.columns:
+        return frame.groupby(column, observed=True)['Count'].sum()
+    return frame[column].value_counts()
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+def amount_counts(dataset):
+    """{Amount bucket: number of projects}, plus every project with an Amount under 'Total'."""
+    counts = _projects(dataset.frame, 'Amount')
+    values = {amount: count for amount, count in counts.items()}
+    values['Total'] = counts.sum().item()
+    return values
@@ -0,0 +1,271 @@
+# The dashboard's filters and aggregations, on pandas or on DuckDB.
+#
+# By default every query below is a slice of the memoized pandas tables in
+# tidy.py and metrics.py. With GB_QUERY_BACKEND=duckdb (`pip install duckdb`)
+# they run in an embedded, in-process DuckDB database instead, so sheets with
+# millions of issue-level rows are scanned by a vectorized engine rather than
+# melted and grouped in pandas:
+#
+#     query.country_ranking(bond_ds, 2020, 'Europe')
+#
+# Each Dataset version is written once to a Parquet file next to the
+# snapshots (GB_SNAPSHOT_DIR/parquet) and exposed as a view over it. Queries
+# are parameterized statements on those views that read only the year
+# columns they need (Parquet is columnar), and their results are memoized per
+# (Dataset, parameters), like everything else derived from a Dataset. Both backends return the same
+# columns, so the page and charts.py don't know which one ran.
+import functools
+import logging
+import os
+import pathlib
+import threading
+import uuid
+
+from green_bonds import instrument, metrics, schema, snapshots, store, tidy
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+log = logging.getLogger(__name__)
+
+# 'pandas' or 'duckdb'
+BACKEND = os.environ.get('GB_QUERY_BACKEND', 'pandas').lower()
+
+# Maximum number of memoized results per query, override with GB_QUERY_CACHE_SIZE
+QUERY_CACHE_SIZE = int(os.environ.get('GB_QUERY_CACHE_SIZE', 128))
+
+# Versions of each dataset with a view, older views are dropped with the
+# Parquet files this process wrote for them
+KEEP_VERSIONS = 2
+
+if BACKEND == 'duckdb' and duckdb is None:
+    log.warning('GB_QUERY_BACKEND=duckdb but duckdb is not installed, using pandas')
+
+_YEARS = r"COLUMNS('^F?\d{4}$')"
+
+_connection = None
+_views = {}  # Dataset -> (view name, Parquet path or None, written by this process)
+_lock = threading.Lock()
+
+
+def duckdb_enabled():
+    return BACKEND == 'duckdb' and duckdb is not None
+
+
+def _parquet_dir():
+    return pathlib.Path(snapshots.SNAPSHOT_DIR) / 'parquet'
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _write_parquet(connection, dataset):
+    # Once per version, the frame goes through DuckDB's own Parquet writer.
+    # Returns the path and whether this process wrote it
+    directory = _parquet_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{dataset.name}-{dataset.version}.parquet'
+    if path.exists():
+        return path, False
+    frame = schema.plain_floats(dataset.frame)  # aggregate the exact values
+    tmp = path.with_name(f'{path.name}.{os.getpid()}-{uuid.uuid4().hex}.tmp')  # other writers have their own
+    connection.register('incoming', frame)
+    try:
+        connection.execute(f'COPY incoming TO {_literal(tmp)} (FORMAT parquet)')
+        os.replace(tmp, path)
+    finally:
+        connection.unregister('incoming')
+        tmp.unlink(missing_ok=True)
+    return path, True
+
+
+def _drop(dataset):
+    # Forget the view of `dataset`, and its Parquet file if this process wrote it
+    name, path, written = _views.pop(dataset)
+    if path is None:
+        _connection.unregister(name)
+        return
+    _connection.execute(f'DROP VIEW IF EXISTS "{name}"')
+    if written:
+        path.unlink(missing_ok=True)
+
+
+@instrument.timed('query.view')
+def _create(dataset):
+    name = f'{dataset.name}_{dataset.version}'
+    if not snapshots.enabled():
+        _connection.register(name, schema.plain_floats(dataset.frame))
+        return name, None, False
+    path, written = _write_parquet(_connection, dataset)
+    _connection.execute(f'CREATE OR REPLACE VIEW "{name}" AS SELECT * FROM read_parquet({_literal(path)})')
+    return name, path, written
+
+
+def view(dataset):
+    """Name of the DuckDB view over `dataset`, created on first use.
+
+    Backed by a Parquet file when the snapshot store is enabled, by the
+    in-memory frame otherwise. The KEEP_VERSIONS latest versions of each
+    dataset keep their view, and a view whose file was removed (by another
+    process, say) is created again.
+    """
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = duckdb.connect()
+        entry = _views.pop(dataset, None)
+        if entry is None or (entry[1] is not None and not entry[1].exists()):
+            entry = _create(dataset)
+        _views[dataset] = entry  # most recently used last
+        versions = [other for other in _views if other.name == dataset.name]
+        for stale in versions[:-KEEP_VERSIONS]:
+            _drop(stale)
+    return entry[0]
+
+
+def _column(dataset, year):
+    # SQL expression of `year`'s column, NULL when the sheet has none
+    for column, value in tidy.year_columns(dataset.frame).items():
+        if value == year:
+            return '"' + str(column).replace('"', '""') + '"'
+    return 'CAST(NULL AS DOUBLE)'
+
+
+def _previous(dataset, year):
+    # The year before `year` among the sheet's years, None for the first
+    earlier = [value for value in tidy.years(dataset) if value < year]
+    return earlier[-1] if earlier else None
+
+
+def _long(source, value_name):
+    # The year columns of `source` as (Year, value_name) rows. Unpivots every
+    # year, so filter the rows in `source` first
+    return (
+        f'SELECT * EXCLUDE (Year), CAST(regexp_extract(Year, \'\\d{{4}}\') AS SMALLINT) AS Year '
+        f'FROM ({source}) UNPIVOT ("{value_name}" FOR Year IN ({_YEARS}))'
+    )
+
+
+def execute(sql, parameters=()):
+    """Run a parameterized `sql` statement on a cursor of this thread, returns a DataFrame."""
+    with _lock:
+        cursor = _connection.cursor()
+    try:
+        return cursor.execute(sql, list(parameters)).df()
+    finally:
+        cursor.close()
+
+
+@store.shared
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+@instrument.timed('query.issuer_year')
+def _duckdb_issuer_year(dataset, year):
+    # Reads only the columns of `year` and the year before it
+    current, previous = _column(dataset, year), _column(dataset, _previous(dataset, year))
+    frame = execute(f'''
+        WITH shares AS (
+            SELECT Type_of_Issuer,
+                CAST({current} AS DOUBLE) AS Value,
+                CAST({previous} AS DOUBLE) AS Previous,
+                Value / SUM(Value) OVER () * 100 AS Percentage,
+                Previous / SUM(Previous) OVER () * 100 AS "Previous Percentage"
+            FROM "{view(dataset)}"
+        )
+        SELECT $1 AS Year, Type_of_Issuer, Value, Percentage,
+            ROW_NUMBER() OVER (ORDER BY Value DESC NULLS LAST) AS Rank,
+            (Value / Previous - 1) * 100 AS "Value Change",
+            Percentage - "Previous Percentage" AS "Share Change"
+        FROM shares
+        WHERE $2
+        ORDER BY Rank
+    ''', [year, year in tidy.years(dataset)])
+    frame['Type_of_Issuer'] = frame['Type_of_Issuer'].astype(dataset.frame['Type_of_Issuer'].dtype)
+    return frame.astype({'Year': 'int16', 'Rank': 'int16'})
+
+
+def issuer_year(dataset, year):
+    """Every issuer's share of `year` in rank order, see metrics.issuer_shares()."""
+    if duckdb_enabled():
+        return _duckdb_issuer_year(dataset, int(year))
+    return tidy.take(metrics.issuer_shares(dataset), int(year))
+
+
+@store.shared
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+@instrument.timed('query.country_ranking')
+def _duckdb_country_ranking(dataset, year, region):
+    value = _column(dataset, year)
+    frame = execute(f'''
+        WITH ranked AS (
+            SELECT $1 AS Year, Region, Country, CAST({value} AS DOUBLE) AS Value,
+                ROW_NUMBER() OVER (ORDER BY Value DESC) AS Rank
+            FROM "{view(dataset)}"
+            WHERE Region IS NOT NULL AND Value IS NOT NULL AND Value <> 0
+        )
+        SELECT * FROM ranked WHERE $2 = 'All' OR Region = $2 ORDER BY Rank
+    ''', [year, region])
+    for column in ('Country', 'Region'):
+        frame[column] = frame[column].astype(dataset.frame[column].dtype)
+    return frame.astype({'Year': 'int16', 'Rank': 'int16'})
+
+
+def country_ranking(dataset, year, region):
+    """Countries issuing in `year` within `region` ('All' for every region), see tidy.bond_long()."""
+    if duckdb_enabled():
+        return _duckdb_country_ranking(dataset, int(year), region)
+    if region == 'All':
+        return tidy.take(tidy.bond_long(dataset), int(year))
+    return tidy.take(tidy.bond_long(dataset), (int(year), region))
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+@instrument.timed('query.category_stats')
+def _duckdb_category_stats(dataset):
+    # A use sheet rolled up from issues (see issues.py) has the extremes in columns of their own
+    rolled_up = 'Count' in dataset.frame.columns
+    maximum, minimum = ('Maximum', 'Minimum') if rolled_up else ('Value', 'Value')
+    frame = execute(f'''
+        SELECT Category, SUM(Value) AS Total, MAX({maximum}) AS Maximum, MIN({minimum}) AS Minimum
+        FROM "{view(dataset)}"
+        WHERE Category IS NOT NULL
+        GROUP BY Category
+        ORDER BY Total DESC
+    ''')
+    frame['Category'] = frame['Category'].astype(dataset.frame['Category'].dtype)
+    return frame.set_index('Category')
+
+
+def category_stats(dataset):
+    """Total, Maximum and Minimum Value per Category, see metrics.category_stats()."""
+    if duckdb_enabled():
+        return _duckdb_category_stats(dataset)
+    return metrics.category_stats(dataset)
+
+
+@store.shared
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+@instrument.timed('query.country_expenditure')
+def _duckdb_country_expenditure(dataset, country):
+    long = _long(f'SELECT * FROM "{view(dataset)}" WHERE Country = $1', 'Expenditure')
+    frame = execute(f'''
+        SELECT Country, Indicator, Year, SUM(Expenditure) AS Expenditure
+        FROM ({long})
+        WHERE Expenditure <> 0
+        GROUP BY Country, Indicator, Year
+        HAVING SUM(Expenditure) <> 0
+        ORDER BY Indicator, Year
+    ''', [country])
+    for column in ('Country', 'Indicator'):
+        frame[column] = frame[column].astype(dataset.frame[column].dtype)
+    return frame.astype({'Year': 'int16'})
+
+
+def country_expenditure(dataset, country):
+    """Expenditure per (Indicator, Year) of `country`, see tidy.expenditure_cube()."""
+    if duckdb_enabled():
+        return _duckdb_country_expenditure(dataset, country)
+    return tidy.take(tidy.expenditure_cube(dataset), country)
@@ -0,0 +1,253 @@
+# Declared dtypes of every dataset, applied when a sheet is loaded.
+#
+# pandas reads the sheets with default dtypes: labels as object strings and
+# numbers as float64/int64. Frames are shared across sessions and kept for
+# the life of the process, so labels become categoricals and year values are
+# downcast to the smallest dtype that still holds every value exactly (e.g.
+# float32 for values with a few decimals, int16 for counts). Year columns keep
+# their string names, the long tables in tidy.py carry the int16 Year.
+#
+# The same declarations validate each new version of a sheet once, when it is
+# fetched, so a broken sheet edit is rejected before it reaches the page.
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from green_bonds import tidy
+
+log = logging.getLogger(__name__)
+
+
+class SchemaError(ValueError):
+    """A dataset version does not match its declared schema."""
+
+    def __init__(self, name, problems):
+        super().__init__(f"Dataset {name!r} failed validation: {'; '.join(problems)}")
+        self.name = name
+        self.problems = problems
+
+
+class Schema:
+    """Label columns (categorical) and extra numeric columns of a dataset.
+
+    Year columns are found by name and always treated as numeric. `required`
+    columns must exist, and a valid version has at least `min_rows` rows and
+    `min_years` year columns. `renames` maps other spellings of a column
+    header to the declared one.
+    """
+
+    def __init__(self, labels=(), numeric=(), required=(), min_rows=1, min_years=1, renames=None):
+        self.renames = dict(renames or {})
+        self.labels = list(labels)
+        self.numeric = list(numeric)
+        self.required = list(required)
+        self.min_rows = min_rows
+        self.min_years = min_years
+
+
+SCHEMAS = {
+    'issuer': Schema(labels=['Type_of_Issuer'], required=['Type_of_Issuer']),
+    'bond': Schema(labels=['Country', 'Region'], required=['Country', 'Region']),
+    'region': Schema(labels=['Region'], required=['Region']),
+    'use': Schema(
+        labels=['Category', 'Use_of_Proceed', 'Amount'],
+        numeric=['Value', 'Count', 'Maximum', 'Minimum'],  # the last three only when rolled up, see issues.py
+        required=['Category', 'Use_of_Proceed', 'Amount', 'Value'],
+        min_years=0,  # one row per category and size, no year columns
+    ),
+    'expenditure': Schema(
+        labels=['Country', 'ISO2', 'ISO3', 'Indicator', 'Unit', 'Source', 'CTS Code', 'CTS Name', 'CTS Full Descriptor'],
+        numeric=['ObjectId'],
+        required=['Country', 'Indicator', 'Unit'],
+    ),
+    'gdp': Schema(labels=['Country'], required=['Country'], renames={'Country Name': 'Country'}),  # World Bank exports
+}
+
+_reports = {}
+_lock = threading.Lock()
+
+
+# Most decimal places looked for in a float column
+MAX_DECIMALS = 6
+
+
+def _decimals(values):
+    # Fewest decimal places (up to MAX_DECIMALS) that every finite float64 value has, None if more
+    finite = values[np.isfinite(values)]
+    for places in range(MAX_DECIMALS + 1):
+        if np.array_equal(np.round(finite, places), finite):
+            return places
+    return None
+
+
+def _distinct_float32(values, places):
+    # Whether float32 keeps every value apart from its neighbours `places`
+    # decimals away, the nearest such decimal of its float32 is then the
+    # value again (and its shortest repr)
+    finite = np.abs(values[np.isfinite(values)])
+    with np.errstate(over='ignore'):
+        ulp = np.spacing(finite.astype('float32')).astype('float64')
+    return bool((ulp * 2 <= 10.0 ** -places).all())
+
+
+def exact_float32(values):
+    """Whether every float64 value survives a float32 round trip through its shortest repr.
+
+    Vectorized: the values need at most MAX_DECIMALS decimal places, few
+    enough for float32 to tell them apart at their magnitude.
+    """
+    values = values.to_numpy(dtype='float64')
+    places = _decimals(values)
+    return places is not None and _distinct_float32(values, places)
+
+
+def _restore(values):
+    # float64 of a float32 column, each value its nearest decimal with the
+    # fewest places that give back the same float32s, see exact_float32()
+    narrow = values.to_numpy()
+    wide = narrow.astype('float64')
+    finite = np.isfinite(narrow)
+    for places in range(MAX_DECIMALS + 1):
+        rounded = np.round(wide, places)
+        if np.array_equal(rounded[finite].astype('float32'), narrow[finite]):
+            if _distinct_float32(rounded, places):
+                return pd.Series(rounded, index=values.index, name=values.name)
+            break
+    # Not narrowed by apply(), take each value's shortest repr
+    return pd.to_numeric(values.astype(str))
+
+
+def plain_floats(frame):
+    """Copy of `frame` with float32 columns back as float64, e.g. for chart JSON.
+
+    Gives the shortest decimal, so 46.9 stored as float32 comes back as
+    46.9 rather than 46.900001525878906.
+    """
+    columns = [column for column in frame.columns if frame[column].dtype == 'float32']
+    if not columns:
+        return frame
+    return frame.assign(**{column: _restore(frame[column]) for column in columns})
+
+
+def _narrow(values):
+    if values.dtype == 'object':
+        converted = pd.to_numeric(values, errors='coerce')
+        # Keep text columns that are not really numeric as they are
+        if converted.notnull().sum() < values.notnull().sum():
+            return values
+        values = converted
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_numeric(values, downcast='integer')
+    if pd.api.types.is_float_dtype(values):
+        whole = values.dropna()
+        if len(whole) == len(values) and (whole == whole.round()).all():
+            return pd.to_numeric(values, downcast='integer')
+        if values.dtype == 'float64' and exact_float32(values):
+            return values.astype('float32')
+    return values
+
+
+def _default_bytes(frame):
+    # What the frame would take with pandas' default dtypes
+    total = frame.index.memory_usage()
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        elif pd.api.types.is_float_dtype(values):
+            values = values.astype('float64')
+        elif pd.api.types.is_integer_dtype(values):
+            values = values.astype('int64')
+        total += values.memory_usage(index=False, deep=True)
+    return int(total)
+
+
+def apply(name, frame):
+    """Return `frame` with the declared dtypes of dataset `name`.
+
+    Headers are renamed first. Declared columns missing from the sheet are
+    skipped, see check(). Records the memory saved against default dtypes,
+    see report().
+    """
+    schema = SCHEMAS.get(name, Schema())
+    renames = {old: new for old, new in schema.renames.items() if old in frame.columns and new not in frame.columns}
+    if renames:
+        frame = frame.rename(columns=renames)
+    columns = {}
+    for column in schema.labels:
+        if column not in frame.columns:
+            continue
+        if not isinstance(frame[column].dtype, pd.CategoricalDtype):
+            columns[column] = frame[column].astype('category')
+    for column in schema.numeric + list(tidy.year_columns(frame)):
+        if column not in frame.columns:
+            continue
+        narrowed = _narrow(frame[column])
+        if narrowed.dtype != frame[column].dtype:
+            columns[column] = narrowed
+    if columns:
+        frame = frame.assign(**columns)
+
+    default, actual = _default_bytes(frame), int(frame.memory_usage(deep=True).sum())
+    with _lock:
+        _reports[name] = {'default_bytes': default, 'bytes': actual, 'saved_bytes': default - actual}
+    return frame
+
+
+def problems(name, frame):
+    """What is wrong with `frame` (after apply()) as a version of dataset `name`."""
+    schema = SCHEMAS.get(name, Schema())
+    found = []
+    missing = [column for column in schema.required if column not in frame.columns]
+    if missing:
+        found.append(f"missing columns {', '.join(map(repr, missing))}")
+    if len(frame) < schema.min_rows:
+        found.append(f'{len(frame)} rows, expected at least {schema.min_rows}')
+
+    years = tidy.year_columns(frame)
+    if len(years) < schema.min_years:
+        found.append(f'{len(years)} year columns, expected at least {schema.min_years}')
+    for column in schema.numeric + list(years):
+        if column in frame.columns and not pd.api.types.is_numeric_dtype(frame[column]):
+            found.append(f'column {column!r} is not numeric')
+    for column in schema.labels:
+        if column in schema.required and column in frame.columns and frame[column].isna().all():
+            found.append(f'column {column!r} is empty')
+    return found
+
+
+def check(name, frame):
+    """Raise SchemaError if `frame` is not a valid version of dataset `name`."""
+    found = problems(name, frame)
+    if found:
+        raise SchemaError(name, found)
+
+
+def report():
+    """{dataset: {'default_bytes', 'bytes', 'saved_bytes'}} of the datasets loaded so far."""
+    with _lock:
+        return {name: dict(values) for name, values in _reports.items()}
+
+
+def record(name, values):
+    """Report `values` for dataset `name`, as apply() measured them when the frame was typed."""
+    with _lock:
+        _reports[name] = dict(values)
+
+
+def main():
+    # python -m green_bonds.schema: load every dataset and print its savings.
+    # Reports live in the imported module, not in this __main__ copy
+    from green_bonds import data, schema
+
+    for name in data.SOURCES:
+        if data.configured(name):
+            data.get(name)
+    for name, values in schema.report().items():
+        print(f"{name}: {values['default_bytes']:,} -> {values['bytes']:,} bytes ({values['saved_bytes']:,} saved)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+# Local snapshot store for the source sheets.
+#
+# Every dataset is kept on disk as a Feather file next to a small JSON file
+# holding the ETag/Last-Modified validators of the response it came from, so
+# the dashboard can start from disk and revalidate with a conditional GET.
+#
+# Every snapshot records the SHA-256 of the CSV it was parsed from. A fetch
+# returning the same bytes is treated like a 304, it is neither parsed nor
+# written again. A fetched version that fails schema validation never
+# replaces the stored one, its raw CSV is kept under quarantine/ for
+# inspection instead.
+#
+# Pre-seed the store (e.g. when building a container image):
+#
+#     python -m green_bonds.snapshots seed
+#     python -m green_bonds.snapshots status
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import uuid
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from green_bonds import schema
+
+try:
+    import pyarrow
+    import pyarrow.feather
+except ImportError:
+    pyarrow = None
+
+log = logging.getLogger(__name__)
+
+# Where snapshots live, override with GB_SNAPSHOT_DIR
+SNAPSHOT_DIR = os.environ.get(
+    'GB_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'snapshots'),
+)
+
+# Store snapshots uncompressed and serve them memory-mapped, enable with
+# GB_SNAPSHOT_MMAP=1. The float columns are then read in place from the page
+# cache, so the worker processes of one host share a single copy of them
+MEMORY_MAP = os.environ.get('GB_SNAPSHOT_MMAP', '').lower() in ('1', 'true', 'yes')
+
+# Retries per request on connection errors and 429/5xx, override with GB_FETCH_RETRIES
+FETCH_RETRIES = int(os.environ.get('GB_FETCH_RETRIES', 3))
+
+
+class Snapshot:
+    """A frame read from (or just written to) the snapshot store."""
+
+    def __init__(self, name, frame, etag=None, last_modified=None, fetched_at=None, digest=None, report=None):
+        self.name = name
+        self.frame = frame  # typed by schema.apply()
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.digest = digest  # SHA-256 of the source CSV
+        self.report = report  # schema.report() of the frame, None for snapshots stored before it was kept
+
+    def age(self):
+        return time.time() - (self.fetched_at or 0)
+
+
+def enabled():
+    return pyarrow is not None
+
+
+def _paths(name, directory):
+    directory = pathlib.Path(directory or SNAPSHOT_DIR)
+    return directory / f'{name}.feather', directory / f'{name}.json'
+
+
+def tmp_path(path):
+    """A file next to `path` to write and then rename to it.
+
+    One per writer, so concurrent processes don't rename each other's
+    half-written files.
+    """
+    return path.with_name(f'{path.name}.{os.getpid()}-{uuid.uuid4().hex}.tmp')
+
+
+def _quarantine_dir(directory):
+    return pathlib.Path(directory or SNAPSHOT_DIR) / 'quarantine'
+
+
+def digest(content):
+    """Content hash of a fetched CSV."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def quarantine(name, content, directory=None):
+    """Keep the raw `content` of a rejected version of `name`, returns its path."""
+    path = _quarantine_dir(directory) / f"{name}-{time.strftime('%Y%m%dT%H%M%S')}-{digest(content)[:12]}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def quarantined(name, directory=None, content_digest=None):
+    """Paths of the quarantined versions of `name` (with `content_digest`), oldest first."""
+    suffix = content_digest[:12] if content_digest else '*'
+    return sorted(_quarantine_dir(directory).glob(f'{name}-*-{suffix}.csv'))
+
+
+def _read_meta(name, directory=None):
+    _, meta_path = _paths(name, directory)
+    try:
+        return json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(name, meta, directory=None):
+    _, meta_path = _paths(name, directory)
+    tmp = tmp_path(meta_path)
+    tmp.write_text(json.dumps(meta, indent=2))
+    os.replace(tmp, meta_path)
+
+
+def read(name, directory=None):
+    """Return the stored Snapshot for `name`, or None if there is none."""
+    if not enabled():
+        return None
+    data_path, _ = _paths(name, directory)
+    if not data_path.exists():
+        return None
+    try:
+        if MEMORY_MAP:
+            # split_blocks keeps each column on its own mapped buffer instead of consolidating copies
+            frame = pyarrow.feather.read_table(data_path, memory_map=True).to_pandas(split_blocks=True)
+        else:
+            frame = pd.read_feather(data_path)
+    except Exception:
+        log.warning('Ignoring unreadable snapshot %s', data_path, exc_info=True)
+        return None
+    meta = _read_meta(name, directory)
+    return Snapshot(
+        name, frame, meta.get('etag'), meta.get('last_modified'), meta.get('fetched_at'), meta.get('sha256'), meta.get('schema'),
+    )
+
+
+def _mappable(frame):
+    # Arrow table of `frame` whose float columns keep NaN instead of nulls. A
+    # column with a validity bitmap is copied by to_pandas(), one without is
+    # handed out as a view of the mapped file
+    table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pyarrow.types.is_floating(field.type):
+            table = table.set_column(i, field, pyarrow.array(frame[field.name].to_numpy(), from_pandas=False))
+    return table
+
+
+def write(name, frame, etag=None, last_modified=None, url=None, directory=None, content_digest=None, report=None):
+    """Store `frame` (typed by schema.apply(), see its `report`) as the snapshot for `name`.
+
+    Returns it as a Snapshot. With MEMORY_MAP that holds the frame mapped
+    from the written file rather than `frame` itself.
+    """
+    fetched_at = time.time()
+    snapshot = Snapshot(name, frame, etag, last_modified, fetched_at, content_digest, report)
+    if not enabled():
+        return snapshot
+    data_path, _ = _paths(name, directory)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so readers never see a half-written file
+    tmp = tmp_path(data_path)
+    try:
+        if MEMORY_MAP:
+            pyarrow.feather.write_feather(_mappable(frame.reset_index(drop=True)), tmp, compression='uncompressed')
+        else:
+            frame.reset_index(drop=True).to_feather(tmp)
+        os.replace(tmp, data_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    _write_meta(name, {
+        'url': url,
+        'etag': etag,
+        'last_modified': last_modified,
+        'fetched_at': fetched_at,
+        'sha256': content_digest,
+        'rows': len(frame),
+        'schema': report,
+    }, directory)
+    if MEMORY_MAP:
+        mapped = read(name, directory)
+        if mapped is not None:
+            snapshot.frame = mapped.frame
+    return snapshot
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session():
+    """The process-wide HTTP session, pooled keep-alive connections with retries."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=FETCH_RETRIES, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def _parse(name, content, directory):
+    # Validated and typed frame of a fetched CSV with its schema report,
+    # quarantines it when invalid. Content
+    # quarantined before is validated again, the schema may have been fixed
+    # since, but kept only once
+    try:
+        frame = schema.apply(name, pd.read_csv(io.BytesIO(content)))
+        report = schema.report()[name]
+        schema.check(name, frame)
+    except (schema.SchemaError, pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        kept = quarantined(name, directory, digest(content))
+        path = kept[-1] if kept else quarantine(name, content, directory)
+        log.warning('Rejected new version of %r, quarantined as %s: %s', name, path, e)
+        raise
+    return frame, report
+
+
+def revalidate(name, source, directory=None, timeout=30, force=False):
+    """Fetch `source` conditionally against the stored snapshot.
+
+    Returns (snapshot, changed). On 304 Not Modified, or when the body has
+    the stored content hash, the stored frame is returned unchanged and only
+    its fetch time is bumped. `force` fetches and parses unconditionally,
+    e.g. to replace a stored snapshot that no longer validates. `source` may
+    also be a local path, e.g. a recorded CSV fixture. Raises SchemaError
+    (or the CSV parser's error) for a version that does not validate, the
+    stored snapshot is kept.
+    """
+    current = None if force else read(name, directory)
+
+    def unchanged(meta_updates):
+        meta = _read_meta(name, directory)
+        meta.update(meta_updates, fetched_at=time.time())
+        current.fetched_at = meta['fetched_at']
+        _write_meta(name, meta, directory)
+        return current, False
+
+    if '://' not in source:
+        content = pathlib.Path(source).read_bytes()
+        content_digest = digest(content)
+        if current is not None and current.digest == content_digest:
+            return unchanged({})
+        frame, report = _parse(name, content, directory)
+        return write(name, frame, url=source, directory=directory, content_digest=content_digest, report=report), True
+    headers = {}
+    if current is not None:
+        if current.etag:
+            headers['If-None-Match'] = current.etag
+        if current.last_modified:
+            headers['If-Modified-Since'] = current.last_modified
+
+    response = session().get(source, headers=headers, timeout=timeout)
+    if response.status_code == 304 and current is not None:
+        return unchanged({})
+    response.raise_for_status()
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    content_digest = digest(response.content)
+    if current is not None and current.digest == content_digest:
+        # Same bytes without a validator match, e.g. a sheet re-published unchanged
+        current.etag, current.last_modified = etag, last_modified
+        return unchanged({'etag': etag, 'last_modified': last_modified})
+
+    frame, report = _parse(name, response.content, directory)
+    return write(name, frame, etag, last_modified, source, directory, content_digest, report), True
+
+
+def main(argv=None):
+    from green_bonds import data
+
+    parser = argparse.ArgumentParser(prog='python -m green_bonds.snapshots', description='Manage local dataset snapshots.')
+    parser.add_argument('--dir', default=None, help=f'snapshot directory (default {SNAPSHOT_DIR})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    seed = sub.add_parser('seed', help='download datasets into the snapshot store')
+    seed.add_argument('names', nargs='*', help='datasets to seed (default all)')
+    sub.add_parser('status', help='list stored snapshots')
+    args = parser.parse_args(argv)
+
+    if not enabled():
+        parser.error('snapshots need pyarrow, install it with `pip install pyarrow`')
+
+    if args.command == 'seed':
+        failed = 0
+        for name in args.names or [name for name in data.SOURCES if data.configured(name)]:
+            try:
+                snapshot, changed = revalidate(name, data.source_url(name), args.dir)
+            except Exception as e:
+                failed += 1
+                print(f'{name}: FAILED ({e})')
+                continue
+            print(f"{name}: {len(snapshot.frame)} rows ({'updated' if changed else 'not modified'})")
+        return 1 if failed else 0
+
+    for name in data.SOURCES:
+        snapshot = read(name, args.dir)
+        if snapshot is None:
+            print(f'{name}: missing')
+        else:
+            print(f'{name}: {len(snapshot.frame)} rows, {snapshot.age():.0f}s old, etag={snapshot.etag}')
+        rejected = quarantined(name, args.dir)
+        if rejected:
+            print(f'{name}: {len(rejected)} quarantined, latest {rejected[-1]}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,45 @@
+# Read-only sharing of the process-wide tables.
+#
+# Every session reads the same loaded frames (data.py) and derived tables
+# (the memoized functions of tidy.py, metrics.py and gdp.py), so a session
+# changing one in place would change it for every user. They are handed out
+# as copy-on-write views instead: a view costs no data copy, and pandas
+# copies a column the first time it is written through the view, the shared
+# table itself never changes.
+#
+#     @store.shared
+#     @functools.lru_cache(maxsize=2)
+#     def issuer_long(dataset): ...
+#
+# Memory-mapping the snapshot files (GB_SNAPSHOT_MMAP, see snapshots.py) lets
+# the worker processes of one host share a single copy of the numeric columns.
+import functools
+import types
+
+import pandas as pd
+
+# pandas 3 always copies on write, earlier versions need the option
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+def view(value):
+    """A copy-on-write view of a shared frame or series, a read-only view of a dict."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, dict):
+        return types.MappingProxyType(value)
+    return value
+
+
+def shared(function):
+    """Decorator over functools.lru_cache returning views of the cached tables."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return view(function(*args, **kwargs))
+
+    # Keep the cache reachable, e.g. for instrument.caches()
+    for name in ('cache_info', 'cache_clear'):
+        if hasattr(function, name):
+            setattr(wrapper, name, getattr(function, name))
+    return wrapper
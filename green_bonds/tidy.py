@@ -0,0 +1,173 @@
+# Long-format ("tidy") tables derived from the source sheets.
+#
+# The sheets are wide, one column per year. Each table here is melted once per
+# data version (functions are memoized on the Dataset), with an integer Year
+# column, categorical labels and a sorted index, so the dashboard filters by
+# slicing the index instead of scanning the whole table on every rerun.
+#
+# Which years there are is read from the sheets' columns (see years()), never
+# assumed, so widgets and charts follow whatever range the data covers.
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
+from green_bonds import instrument, store
+
+_YEAR = re.compile(r'^F?(\d{4})$')
+
+
+def year_columns(frame):
+    """Map each year column of a wide frame to its year, e.g. {'2012': 2012}."""
+    years = {}
+    for column in frame.columns:
+        match = _YEAR.match(str(column))
+        if match:
+            years[column] = int(match.group(1))
+    return years
+
+
+@functools.lru_cache(maxsize=8)
+def years(*datasets):
+    """Sorted tuple of every year with a column in any of `datasets`."""
+    found = set()
+    for dataset in datasets:
+        found.update(year_columns(dataset.frame).values())
+    return tuple(sorted(found))
+
+
+def _categorical(values):
+    # Categories in order of appearance, so sorting keeps the sheet's order
+    return pd.Categorical(values, categories=pd.unique(values.dropna()))
+
+
+@instrument.timed('tidy.melt')
+def melt(frame, id_vars, value_name):
+    """Long format of a wide sheet, with an int16 Year and categorical `id_vars`."""
+    years = year_columns(frame)
+    long = frame.melt(id_vars=id_vars, value_vars=list(years), var_name='Year', value_name=value_name)
+    long['Year'] = long['Year'].map(years).astype('int16')
+    for column in id_vars:
+        long[column] = _categorical(long[column])
+    return long
+
+
+@instrument.timed('tidy.take')
+def take(table, key):
+    """Rows of an indexed table under `key` (a full or leading index key).
+
+    The index is sorted, so this is a binary search plus a slice. Missing
+    keys give an empty frame. The index is returned as regular columns.
+    """
+    try:
+        rows = table.index.get_loc(key)
+    except KeyError:
+        rows = slice(0, 0)
+    return table.iloc[rows].reset_index()
+
+
+class RowIndex:
+    """Contiguous column arrays of a table sorted by `key`, plus each key's row range.
+
+    Gathering rows for a handful of keys then costs O(rows returned): one
+    dict lookup and one array slice per key and column.
+    """
+
+    def __init__(self, table, key):
+        frame = table.reset_index()
+        self.columns = {}
+        self.categories = {}
+        for column in frame.columns:
+            values = frame[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                self.categories[column] = values.cat.categories
+                self.columns[column] = values.cat.codes.to_numpy()
+            else:
+                self.columns[column] = values.to_numpy()
+        for values in self.columns.values():
+            values.flags.writeable = False  # shared by every session
+
+        # Rows of one key are adjacent, so each key maps to a [start, stop) range
+        keys = frame[key].to_numpy()
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(keys)]
+        self.offsets = {keys[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+    @instrument.timed('tidy.gather')
+    def gather(self, keys):
+        """Rows of `keys` (in that order) as a DataFrame, unknown keys are skipped."""
+        ranges = [self.offsets[key] for key in keys if key in self.offsets]
+        columns = {}
+        for column, values in self.columns.items():
+            parts = [values[start:stop] for start, stop in ranges]
+            gathered = np.concatenate(parts) if parts else values[:0]
+            if column in self.categories:
+                gathered = pd.Categorical.from_codes(gathered, self.categories[column])
+            columns[column] = gathered
+        return pd.DataFrame(columns)
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+def issuer_long(dataset):
+    """Type_of_Issuer, Value per Year, indexed by Year."""
+    long = melt(dataset.frame, ['Type_of_Issuer'], 'Value')
+    return long.set_index('Year').sort_index(kind='stable')
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+def bond_long(dataset):
+    """Country, Value, Rank per (Year, Region), issuing countries with a region only.
+
+    Rank is the country's place among all countries that year, and the rows
+    of each (Year, Region) are ordered largest first.
+    """
+    long = melt(dataset.frame, ['Country', 'Region'], 'Value')
+    long = long.dropna(subset=['Region'])  # Exclude rows with NULL in Region column
+    long = long[long['Value'].notnull() & (long['Value'] != 0)]
+    long = long.sort_values('Value', ascending=False, kind='stable')
+    long['Rank'] = long.groupby('Year').cumcount().add(1).astype('int16')
+    return long.set_index(['Year', 'Region']).sort_index(kind='stable')
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+def expenditure_long(dataset):
+    """Indicator, Unit, Expenditure per (Country, Year), non-zero values only."""
+    long = melt(dataset.frame, ['Country', 'Indicator', 'Unit'], 'Expenditure')
+    long = long[long['Expenditure'].notnull() & (long['Expenditure'] != 0)]
+    return long.set_index(['Country', 'Year']).sort_index(kind='stable')
+
+
+@store.shared
+@functools.lru_cache(maxsize=2)
+@instrument.timed('tidy.expenditure_cube')
+def expenditure_cube(dataset):
+    """Expenditure summed per (Country, Indicator, Year), indexed the same way.
+
+    The chart shows one bar segment per indicator and year, so this is all
+    it needs to receive instead of the raw rows.
+    """
+    long = expenditure_long(dataset).reset_index()
+    cube = long.groupby(['Country', 'Indicator', 'Year'], observed=True, sort=False)['Expenditure'].sum()
+    return cube[cube != 0].to_frame().sort_index(kind='stable')
+
+
+@functools.lru_cache(maxsize=2)
+def expenditure_index(dataset):
+    """RowIndex over the expenditure cube by Country."""
+    return RowIndex(expenditure_cube(dataset), 'Country')
+
+
+@functools.lru_cache(maxsize=2)
+def expenditure_countries(dataset):
+    """Every country in the expenditure sheet, in sheet order."""
+    return tuple(dataset.frame['Country'].dropna().unique().tolist())
+
+
+@functools.lru_cache(maxsize=2)
+def bond_regions(dataset):
+    """Every region in the bond sheet, in sheet order."""
+    return tuple(dataset.frame['Region'].dropna().unique().tolist())
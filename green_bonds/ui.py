@@ -0,0 +1,50 @@
+# Streamlit helpers for the dashboard's sections.
+#
+# Expanders and tabs created here track their state (on_change='rerun'), so
+# the page can skip the work behind a collapsed expander or an inactive tab
+# instead of computing and sending it on every rerun:
+#
+#     details = ui.expander('Details', key='details')
+#     with details:
+#         if ui.is_open(details):
+#             ...
+#
+# On Streamlit versions that can't track state everything renders as before.
+import streamlit as st
+
+from green_bonds import data
+
+
+def expander(label, key, expanded=False):
+    try:
+        return st.expander(label, expanded=expanded, key=key, on_change='rerun')
+    except TypeError:
+        return st.expander(label, expanded=expanded)
+
+
+def tabs(labels, key):
+    try:
+        return st.tabs(labels, key=key, on_change='rerun')
+    except TypeError:
+        return st.tabs(labels)
+
+
+def is_open(container):
+    """False only for an expander or tab known to be hidden."""
+    return getattr(container, 'open', None) is not False
+
+
+def available(*names):
+    """Load `names`, or show a warning in their section and return False.
+
+    Lets one section degrade on its own when its sheet can't be fetched.
+    """
+    missing = []
+    for name in names:
+        try:
+            data.get(name)
+        except data.Unavailable:
+            missing.append(name)
+    if missing:
+        st.warning(f"This section's data ({', '.join(missing)}) can't be loaded right now, please try again later.", icon='⚠️')
+    return not missing